@@ -1,7 +1,11 @@
 from io import StringIO
-from moonraker import Moonraker
-import numpy as np
-import pyperclip
+import bisect
+import copy
+import json
+import math
+
+# moonraker (requests), pyperclip, NumPy (gcode_validator, gcode_encoding) are imported in the methods using them,
+# such that pure offline generation starts fast.
 
 class CAM_Interface:
 
@@ -17,6 +21,12 @@ class CAM_Interface:
         t0_temp: float - Temperatur Tool 0
         tn_temp: float - Temperatur Tool n
         bed_temp:  float - Temperatur Druckbett
+        machine_limits: dict - Limits for validation on save, see gcode_validator
+        preview_tolerance: float - Simplification tolerance (mm) of preview for viewer/clipboard in simulation
+        preview_max_moves: int - Max. printing moves of preview for viewer/clipboard in simulation
+        auto_checkpoint: bool - Record checkpoint before every change of Z (layer boundaries)
+        travel_policy: dict - Skip z-lift/retraction of travels over printed material, see travel_planner.TravelPolicy
+                        (e.g. {"min_distance": 2, "combing": true}). Cell size defaults to layer_width
         """
         self._gcode_script = StringIO("")
         self._properties = kwargs
@@ -34,7 +44,15 @@ class CAM_Interface:
         self._x = 0.0
         self._y = 0.0
         self._z = 0.0
-
+        # Checkpoints: Zustand und Offset im Skript an Layer-/Abschnittsgrenzen
+        self._checkpoints = []
+        # Räumlicher Index gedruckter Segmente für bedingtes Z-Lift/Retract
+        self._travel_policy = None
+        if self._properties.get('travel_policy') is not None:
+            from travel_planner import TravelPolicy
+            settings = dict(self._properties['travel_policy'])
+            settings.setdefault('cell_size', self._properties.get('layer_width') or 1.)
+            self._travel_policy = TravelPolicy(**settings)
 
         self._prepare_print()
 
@@ -97,10 +115,21 @@ class CAM_Interface:
         :param  kwargs: x,y,z - Position in mm, f - feedrate in mm/min,
                 inc - boolean incremental mode/G91 (default is G90)
        """
+        self._layer_checkpoint(**kwargs)
         code = ""
         z_lift = kwargs['z_lift'] if 'z_lift' in kwargs and not self._simulation else 0
         inc = 'inc' in kwargs and kwargs['inc']
         retract = 'retract' in kwargs and kwargs['retract']
+        route = []
+        if self._travel_policy is not None and 'z' not in kwargs and ('x' in kwargs or 'y' in kwargs):
+            target = (self._x + kwargs.get('x', 0) if inc else kwargs.get('x', self._x),
+                      self._y + kwargs.get('y', 0) if inc else kwargs.get('y', self._y))
+            lift, retract, route = self._travel_policy.plan(self.get_pos(), target, z_lift > 0,
+                                                            retract and not self._simulation)
+            z_lift = z_lift if lift else 0
+            if route:
+                # Letzte Teilstrecke immer mit X und Y, Wegpunkte ändern beide Achsen
+                kwargs['x'], kwargs['y'] = (target[0] - route[-1][0], target[1] - route[-1][1]) if inc else target
         # most G-Code Visualizer do not work with G10/G11 (firmware retraction in klipper)
         if retract and not self._simulation:
             code += f"; Retract\nG10\n"
@@ -109,6 +138,15 @@ class CAM_Interface:
             self._backlash_compensation(z_lift)
             code += f"; Z-Lift\nG1Z{z_lift:.3f}\n"
         self._set_mode(inc)
+        # Vorschub der Fahrt gilt ab dem ersten Wegpunkt, nicht erst auf der letzten Teilstrecke
+        feed = f"F{kwargs['f']:.3f}" if 'f' in kwargs else ""
+        for x, y in route:
+            # Combing über gedrucktem Material
+            if inc:
+                x, y = x - self._x, y - self._y
+            code += f"G1X{x:.3f}Y{y:.3f}{feed}\n"
+            feed = ""
+            self._update_pos(x=x, y=y)
         code += "G1"
         if 'x' in kwargs:
             code += f"X{kwargs['x']:.3f}"
@@ -121,7 +159,7 @@ class CAM_Interface:
             code += f"Z{kwargs['z']:.3f}"
             self._update_pos(z=kwargs['z'])
         if 'f' in kwargs:
-            code += f"F{kwargs.get('f'):.3f}"
+            code += feed
             self._properties['feedrate'] = kwargs.get('f')
         code += "\n"
         if not ('z' in kwargs) and z_lift > 0:
@@ -194,8 +232,10 @@ class CAM_Interface:
 
         :param kwargs: x,y,z,e - Position in mm, f - Feedrate in mm/min,
         """
+        self._layer_checkpoint(**kwargs)
         inc = 'inc' in kwargs and kwargs['inc']
         absolute = not inc
+        start = self.get_pos()
         self._set_mode(inc)
         distance = .0
         code = "G1"
@@ -212,7 +252,9 @@ class CAM_Interface:
             distance += (absolute * self._z - kwargs['z']) ** 2
             code += f"Z{kwargs['z']:.3f}"
             self._update_pos(z=kwargs['z'])
-        code += f"E{self._get_extrusion_distance(np.sqrt(distance)):.6f}"
+        code += f"E{self._get_extrusion_distance(math.sqrt(distance)):.6f}"
+        if self._travel_policy is not None:
+            self._travel_policy.register(start, self.get_pos(), self._properties['layer_width'])
         if 'f' in kwargs:
             code += f"F{kwargs.get('f'):.3f}"
             self._properties['feedrate'] = kwargs.get('f')
@@ -302,6 +344,22 @@ class CAM_Interface:
         """
         return self._x, self._y, self._z
 
+    def get_travel_statistics(self) -> dict:
+        """
+        Returns statistics of travel policy (travels, saved z-lifts and retractions, combed travels).
+
+        :return: dict or None, if print property travel_policy is not set
+        """
+        return self._travel_policy.statistics() if self._travel_policy is not None else None
+
+    def get_script(self) -> str:
+        """
+        Returns generated G-code script.
+
+        :return: G-code script
+        """
+        return self._gcode_script.getvalue()
+
     def _get_extrusion_distance(self, length: float) -> float:
         """
         Calculates extrusion distance on given length of GCode move. E Value for G-code
@@ -318,7 +376,7 @@ class CAM_Interface:
         # from https://manual.slic3r.org/advanced/flow-math
         if self._properties['layer_width'] > 1.05 * self._properties['nozzle_diameter']:
             # E = (4/pi*(w - h) * h + h^2) * L / d_F^2
-            return (4 / np.pi * (self._properties['layer_width'] - self._properties['layer_height']) *
+            return (4 / math.pi * (self._properties['layer_width'] - self._properties['layer_height']) *
                     self._properties['layer_height'] + self._properties['layer_height'] ** 2) * length / \
                    self._properties[
                        'filament_diameter'] ** 2
@@ -326,7 +384,7 @@ class CAM_Interface:
             # https://github.com/slic3r/Slic3r/issues/3118
             # E = (4*L*w*h)/(pi*D_F²)
             return (4 * length * self._properties['layer_width'] * self._properties['layer_height']) / (
-                        np.pi * self._properties['filament_diameter'] ** 2)
+                        math.pi * self._properties['filament_diameter'] ** 2)
 
     def get_print_property(self, keyword: str):
         """
@@ -437,6 +495,279 @@ class CAM_Interface:
                 self._gcode_script.write(f"UNRETRACT_SPEED={kwargs['un_speed']}")
             self._gcode_script.write("\n")
 
+    # Checkpoints #
+    def _get_state(self) -> dict:
+        """
+        Returns serialisable snapshot of generator state.
+        """
+        return {'x': self._x, 'y': self._y, 'z': self._z, 'inc_mode': self._inc_mode,
+                'last_z_cw': self._last_z_cw, 'toolhead': self._toolhead,
+                'properties': copy.deepcopy(self._properties)}
+
+    def _set_state(self, state: dict):
+        """
+        Restores generator state from snapshot.
+        """
+        self._x, self._y, self._z = state['x'], state['y'], state['z']
+        self._inc_mode = state['inc_mode']
+        self._last_z_cw = state['last_z_cw']
+        self._toolhead = state['toolhead']
+        self._properties = copy.deepcopy(state['properties'])
+
+    def _layer_checkpoint(self, **kwargs):
+        """
+        Records checkpoint before move, if move changes Z and print property 'auto_checkpoint' is set.
+
+        :param kwargs: kwargs of move
+        """
+        if 'z' in kwargs and self._properties.get('auto_checkpoint'):
+            new_z = self._z + kwargs['z'] if kwargs.get('inc') else kwargs['z']
+            if new_z != self._z:
+                self.checkpoint(f"z={new_z:.3f}")
+
+    def checkpoint(self, name=None):
+        """
+        Records checkpoint: snapshot of state (position, G90/G91, backlash direction, properties) and offset in
+        script. Generation can be resumed or single sections can be regenerated from checkpoints.
+
+        :param name: name of checkpoint. Default is number of checkpoint. Names are unique, repeated names get a
+                     suffix with their count (e.g. square_aperture, square_aperture#2)
+        :return: checkpoint dict
+        """
+        name = self._unique_name(name if name is not None else str(len(self._checkpoints)),
+                                 {c['name'] for c in self._checkpoints})
+        checkpoint = {'name': name, 'offset': self._gcode_script.tell(), 'state': self._get_state()}
+        self._checkpoints.append(checkpoint)
+        return checkpoint
+
+    @staticmethod
+    def _unique_name(name: str, names) -> str:
+        """
+        Returns name with suffix '#<count>', if name is already used.
+        """
+        if name not in names:
+            return name
+        count = 2
+        while f"{name}#{count:d}" in names:
+            count += 1
+        return f"{name}#{count:d}"
+
+    def _remap_checkpoints(self, original: str, script: str, removed_lines=()):
+        """
+        Moves checkpoints to the same line of a rewritten script, in which lines were changed or removed, but not
+        added or reordered.
+
+        :param original: script the checkpoints were recorded in
+        :param script: rewritten script
+        :param removed_lines: indices of lines of original, which do not exist in script anymore
+        """
+        removed = sorted(removed_lines)
+        starts = [0]
+        for line in script.split('\n'):
+            starts.append(starts[-1] + len(line) + 1)
+        for checkpoint in self._checkpoints:
+            self._check_offset(checkpoint, original)
+            line = original.count('\n', 0, checkpoint['offset'])
+            line -= bisect.bisect_left(removed, line)
+            checkpoint['offset'] = min(starts[line], len(script))
+
+    @staticmethod
+    def _check_offset(checkpoint: dict, script: str):
+        """
+        Raises ValueError, if checkpoint does not point to the start of a line of script (e.g. script was changed
+        without updating checkpoints).
+        """
+        offset = checkpoint['offset']
+        if offset > len(script) or (offset > 0 and script[offset - 1] != '\n'):
+            raise ValueError(f"Checkpoint {checkpoint['name']} does not point to start of a line of the script")
+
+    def get_checkpoints(self) -> list:
+        """
+        Returns all checkpoints with character offset, byte offset (UTF-8) and line number in script.
+
+        :return: list of checkpoint dicts
+        """
+        script = self._gcode_script.getvalue()
+        checkpoints = []
+        last, byte_offset, line = 0, 0, 0
+        for checkpoint in self._checkpoints:
+            part = script[last:checkpoint['offset']]
+            byte_offset += len(part.encode('utf-8'))
+            line += part.count('\n')
+            last = checkpoint['offset']
+            checkpoint = dict(checkpoint)
+            checkpoint.update(byte_offset=byte_offset, line=line)
+            checkpoints.append(checkpoint)
+        return checkpoints
+
+    def _find_checkpoint(self, checkpoint) -> int:
+        """
+        Returns index of checkpoint given by index, name or checkpoint dict.
+        """
+        if isinstance(checkpoint, int):
+            return checkpoint
+        name = checkpoint['name'] if isinstance(checkpoint, dict) else checkpoint
+        found = [i for i, c in enumerate(self._checkpoints) if c['name'] == name]
+        if not found:
+            raise ValueError(f"Checkpoint {name!s} does not exist!")
+        if len(found) > 1:
+            # Nur bei geladenen Checkpoints möglich (checkpoint() vergibt eindeutige Namen)
+            raise ValueError(f"Checkpoint name {name!s} is ambiguous! Use index")
+        return found[0]
+
+    def restore(self, checkpoint):
+        """
+        Resets generator to checkpoint. Script after checkpoint and later checkpoints are discarded.
+
+        :param checkpoint: index, name or checkpoint dict
+        """
+        i = self._find_checkpoint(checkpoint)
+        checkpoint = self._checkpoints[i]
+        self._check_offset(checkpoint, self._gcode_script.getvalue())
+        self._gcode_script.seek(checkpoint['offset'])
+        self._gcode_script.truncate()
+        self._set_state(checkpoint['state'])
+        self._checkpoints = self._checkpoints[:i]
+        if self._travel_policy is not None:
+            self._travel_policy.clear()
+            self._travel_policy.register_script(self._gcode_script.getvalue(), self._properties['layer_width'])
+
+    def replace_section(self, checkpoint, generate, check=True):
+        """
+        Regenerates section between checkpoint and next checkpoint and splices it into script. Rest of the
+        script is not recomputed.
+
+        :param checkpoint: index, name or checkpoint dict of section start
+        :param generate: callable getting CAM_Interface (at state of checkpoint), generates new section
+        :param check: raise Exception, if state at end of new section differs from state at next checkpoint.
+                      Without check, states of later checkpoints are not updated
+        """
+        i = self._find_checkpoint(checkpoint)
+        start = self._checkpoints[i]
+        following = self._checkpoints[i + 1:]
+        end_offset = following[0]['offset'] if following else self._gcode_script.tell()
+        script = self._gcode_script.getvalue()
+        for c in [start] + following[:1]:
+            self._check_offset(c, script)
+        section = CAM_Interface.from_checkpoint(start, script)
+        generate(section)
+        if not section._checkpoints or section._checkpoints[0]['offset'] > start['offset']:
+            # Abschnitt beginnt weiterhin mit dem Checkpoint, falls generate keinen gesetzt hat
+            section._checkpoints.insert(0, start)
+        names = {c['name'] for c in self._checkpoints[:i] + following}
+        for c in section._checkpoints:
+            if c is not start:
+                c['name'] = self._unique_name(c['name'], names)
+            names.add(c['name'])
+        end_state = following[0]['state'] if following else None
+        if check and end_state is not None:
+            new_state = section._get_state()
+            for key in ('x', 'y', 'z', 'inc_mode', 'last_z_cw', 'toolhead'):
+                if new_state[key] != end_state[key]:
+                    raise Exception(f"Regenerated section ends with {key}={new_state[key]!s} instead of "
+                                    f"{end_state[key]!s}. Splicing would corrupt the rest of the script.")
+        new = section.get_script()[start['offset']:]
+        shift = start['offset'] + len(new) - end_offset
+        self._gcode_script = StringIO(script[:start['offset']] + new + script[end_offset:])
+        self._gcode_script.seek(0, 2)
+        for c in following:
+            c['offset'] += shift
+        self._checkpoints = self._checkpoints[:i] + section._checkpoints + following
+        if end_state is None:
+            self._set_state(section._get_state())
+        if self._travel_policy is not None:
+            self._travel_policy.clear()
+            self._travel_policy.register_script(self._gcode_script.getvalue(), self._properties['layer_width'])
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint: dict, script: str):
+        """
+        Creates CAM_Interface to continue generation at checkpoint. Script is cut at offset of checkpoint.
+
+        :param checkpoint: checkpoint dict (see get_checkpoints/load_checkpoints)
+        :param script: script the checkpoint was recorded in. Empty string to start with empty script
+        :return: CAM_Interface
+        """
+        interface = cls(**copy.deepcopy(checkpoint['state']['properties']))
+        interface._gcode_script = StringIO(script[:checkpoint['offset']])
+        interface._gcode_script.seek(0, 2)
+        interface._set_state(checkpoint['state'])
+        if interface._travel_policy is not None:
+            interface._travel_policy.register_script(script[:checkpoint['offset']],
+                                                     interface._properties['layer_width'])
+        return interface
+
+    def resume_script(self, checkpoint, z_clearance=1.) -> str:
+        """
+        Returns script to resume a failed print at checkpoint: start code, approach of checkpoint position from
+        above, backlash direction, G90/G91, overrides and feedrate as in the original script, followed by the rest
+        of the script after the checkpoint.
+
+        :param checkpoint: index, name or checkpoint dict
+        :param z_clearance: approach height above checkpoint Z in mm
+        :return: G-code script
+        """
+        checkpoint = self._checkpoints[self._find_checkpoint(checkpoint)]
+        state = checkpoint['state']
+        script = self._gcode_script.getvalue()
+        self._check_offset(checkpoint, script)
+        resume = CAM_Interface(**copy.deepcopy(state['properties']))
+        resume._toolhead = state['toolhead']
+        resume.add_comment(f"Resume at checkpoint {checkpoint['name']}")
+        resume.abs_move(z=state['z'] + z_clearance)
+        resume.abs_move(x=state['x'], y=state['y'])
+        resume.abs_move(z=state['z'])
+        if resume._last_z_cw != state['last_z_cw']:
+            # Spiel in Richtung der letzten Z-Bewegung des Originals umlegen (FORCE_MOVE, keine Positionsänderung)
+            resume._set_relative_mode()
+            resume._backlash_compensation(-1. if state['last_z_cw'] else 1.)
+        resume._set_mode(state['inc_mode'])
+        if state['properties']['speed_override'] != 100:
+            resume.set_speed_override(state['properties']['speed_override'])
+        if state['properties']['extrude_override'] != 100:
+            resume.set_extrude_override(state['properties']['extrude_override'])
+        feedrate = self._last_feedrate(script[:checkpoint['offset']])
+        if feedrate is not None:
+            resume.set_feedrate(feedrate)
+        return resume.get_script() + script[checkpoint['offset']:]
+
+    @staticmethod
+    def _last_feedrate(script: str):
+        """
+        Returns last feedrate (F word of G0/G1) of script or None.
+        """
+        for line in reversed(script.split('\n')):
+            words = line.split(';')[0].upper()
+            if words.startswith(('G0', 'G1')) and 'F' in words:
+                number = ''
+                for char in words[words.rindex('F') + 1:].lstrip():
+                    if not (char.isdigit() or char in '.-+'):
+                        break
+                    number += char
+                return float(number)
+        return None
+
+    def save_checkpoints(self, filename: str):
+        """
+        Saves checkpoints (JSON) for later resume.
+
+        :param filename: filename / relative path
+        """
+        with open(f"{filename}", mode='w') as f:
+            json.dump(self.get_checkpoints(), f, indent=1, default=float)
+            print(f"Checkpoints saved at {filename}")
+
+    @staticmethod
+    def load_checkpoints(filename: str) -> list:
+        """
+        Loads checkpoints saved with save_checkpoints().
+
+        :param filename: filename / relative path
+        :return: list of checkpoint dicts
+        """
+        with open(f"{filename}") as f:
+            return json.load(f)
+
     # Methoden für Skript #
     def add_comment(self, comment: str):
         """
@@ -446,35 +777,134 @@ class CAM_Interface:
         """
         self._gcode_script.write(f"; {comment}\n")
 
-    def save_script(self, filename: str):
+    def validate_script(self, **limits):
         """
-        Save G-Code script under given (relative) path.
+        Checks G-Code script against machine limits (envelope, E values, feedrate, volumetric flow).
+        Limits given as print property 'machine_limits' are used as default.
 
-        :param filename: filename / relative path
+        :param limits: see gcode_validator
+        :return: ValidationReport
         """
-        with open(f"{filename}", mode='w') as f:
-            print(self._gcode_script.getvalue(), file=f)
-            print(f"File saved at {filename}")
+        kwargs = dict(self._properties.get('machine_limits', {}))
+        kwargs.setdefault('filament_diameter', self._properties.get('filament_diameter'))
+        kwargs.update(limits)
+        import gcode_validator
+        return gcode_validator.validate(self._gcode_script.getvalue(), **kwargs)
+
+    def plan_feedrates(self, coalesce=60., **limits):
+        """
+        Rewrites feedrates of whole script: every printing move gets the fastest feedrate allowed by max.
+        volumetric flow and machine speed limits (see feedrate_planner). Limits given as print property
+        'machine_limits' are used as default.
+
+        :param coalesce: feedrates are rounded down to multiples of this step (mm/min) and only written on change
+        :param limits: max_flow, max_feedrate, axis_limits, min_feedrate, travel_feedrate
+        """
+        import feedrate_planner
+        from toolpath import parse_gcode
+        kwargs = {key: value for key, value in self._properties.get('machine_limits', {}).items()
+                  if key in ('max_flow', 'max_feedrate', 'axis_limits', 'min_feedrate', 'travel_feedrate')}
+        kwargs.update(limits)
+        original = self._gcode_script.getvalue()
+        toolpath = parse_gcode(original)
+        feedrates = feedrate_planner.plan(toolpath, self._properties['filament_diameter'], **kwargs)
+        script = feedrate_planner.rewrite(original, toolpath, feedrates, coalesce)
+        # Zeilen bleiben erhalten, nur reine Vorschubzeilen ohne Kommentar entfallen (siehe rewrite)
+        lines = original.split('\n')
+        self._remap_checkpoints(original, script, [i for i in toolpath.feed_lines if ';' not in lines[i]])
+        self._gcode_script = StringIO(script)
+        self._gcode_script.seek(0, 2)
 
-    def upload_script(self, filename: str):
+    def save_script(self, filename: str, encoding='plain', loops=False):
+        """
+        Save G-Code script under given (relative) path.
+        Script is validated before, if print property 'machine_limits' is set.
+
+        :param filename: filename / relative path
+        :param encoding: 'plain' (default), 'gzip', 'meatpack' or 'bgcode', see gcode_encoding
+        :param loops: replace repeated move blocks by klipper macro loops, see gcode_loops. Macros are saved as
+                      config snippet <filename>.cfg, which has to be included in printer.cfg. Takes about 1 s per
+                      100k lines of moves without loops (less for scripts with loops)
+        """
+        if self._properties.get('machine_limits'):
+            print(self.validate_script())
+        script = self._gcode_script
+        if loops:
+            import gcode_loops
+            original = self._gcode_script.getvalue()
+            script, config = gcode_loops.compress(original)
+            gcode_loops.check_round_trip(original, script, config)
+            with open(f"{filename}.cfg", mode='w') as f:
+                f.write(config)
+            print(f"Loop macros saved at {filename}.cfg ({len(original.splitlines()):d} -> "
+                  f"{len(script.splitlines()):d} lines)")
+        if encoding == 'plain':
+            with open(f"{filename}", mode='w') as f:
+                print(script if loops else script.getvalue(), file=f)
+                print(f"File saved at {filename}")
+            return
+        import gcode_encoding
+        metadata = {'printer': {key: self._properties[key] for key in ('nozzle_diameter', 'filament_diameter')
+                                if key in self._properties}}
+        with open(f"{filename}", mode='wb') as f:
+            size = gcode_encoding.write(script, f, encoding, metadata=metadata)
+            print(f"File saved at {filename} ({encoding:s}, {size:d} bytes)")
+
+    def upload_script(self, filename: str, encoding='plain'):
         """
         Upload script via moonraker API
 
         :param filename: filename
+        :param encoding: only 'plain', klipper prints G-code text only. 'gzip', 'meatpack' and 'bgcode' are
+                         transfer/archive formats, see save_script
         """
         #@Todo: upload via moonraker api
+        if encoding != 'plain':
+            raise ValueError(f"Encoding {encoding:s} can't be printed by klipper! Upload plain G-code")
         if 'simulation' in self._properties and self._properties['simulation']:
-            self.save_script(f"/home/ptnano/webgcode/webapp/samples/show_me.gcode")
-            self.copy_to_clipboard()
+            tolerance = self._properties.get('preview_tolerance')
+            max_moves = self._properties.get('preview_max_moves')
+            if tolerance is None and max_moves is None:
+                self.save_script(f"/home/ptnano/webgcode/webapp/samples/show_me.gcode")
+            else:
+                with open("/home/ptnano/webgcode/webapp/samples/show_me.gcode", mode='w') as f:
+                    f.write(self.get_preview(tolerance, max_moves))
+                    print("Preview saved at /home/ptnano/webgcode/webapp/samples/show_me.gcode")
+            self.copy_to_clipboard(tolerance, max_moves)
         else:
             self.save_script(f"/home/ptnano/gcode_files/{filename}.gcode")
 
-    def copy_to_clipboard(self):
+    def get_preview(self, tolerance=None, max_moves=None) -> str:
         """
-        Copy Gcode script to clipboard. E.g. for verifying with ncviewer.com or repetier host.
+        Returns simplified G-code of printing moves for viewers (Douglas-Peucker, see preview).
+        The script itself is not changed.
+
+        :param tolerance: Simplification tolerance in mm
+        :param max_moves: Max. number of printing moves, used if tolerance is None
+        :return: G-code preview
         """
-        print("Script copied to clipboard.")
-        pyperclip.copy(self._gcode_script.getvalue())
+        import preview
+        return preview.Preview(self._gcode_script.getvalue()).to_gcode(tolerance, max_moves)
+
+    def copy_to_clipboard(self, tolerance=None, max_moves=None):
+        """
+        Copy Gcode script to clipboard. E.g. for verifying with ncviewer.com or repetier host.
+        If tolerance or max_moves is given, a simplified preview is copied instead of full script.
+        Defaults are the print properties preview_tolerance and preview_max_moves.
+
+        :param tolerance: Simplification tolerance of preview in mm
+        :param max_moves: Max. number of printing moves of preview
+        """
+        import pyperclip
+        if tolerance is None and max_moves is None:
+            tolerance = self._properties.get('preview_tolerance')
+            max_moves = self._properties.get('preview_max_moves')
+        if tolerance is None and max_moves is None:
+            print("Script copied to clipboard.")
+            pyperclip.copy(self._gcode_script.getvalue())
+        else:
+            print("Preview copied to clipboard.")
+            pyperclip.copy(self.get_preview(tolerance, max_moves))
 
     def show_script(self):
         """
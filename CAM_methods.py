@@ -1,5 +1,3 @@
-import numpy as np
-
 from CAM_Interface import CAM_Interface
 
 """
@@ -23,6 +21,7 @@ class CAM_structures():
         :param inner: Inner length in mm
         :param overlap: layer overlap in percent
         """
+        self._interface.checkpoint('square_aperture')
         a = outer
         b = self._interface.get_print_property('layer_width') * (1-overlap)
         while a > inner:
@@ -46,6 +45,7 @@ class CAM_structures():
         :param inner_y: Seitenlänge Aussparung/Loch in mm
         :param overlap: Prozentualer überlapp der Schichten
         """
+        self._interface.checkpoint('rect_aperture')
         start_pos = self._interface.get_pos()
         x = (outer_x - inner_x) / 2
         y = (outer_y - inner_y) / 2
@@ -113,6 +113,7 @@ class CAM_structures():
         :param length: length of bars
         :return:
         """
+        self._interface.checkpoint('lattice')
         a = n
         while a > 0:
             self._interface.rel_print(x=length)
@@ -0,0 +1,128 @@
+#!/usr/bin/python3.8
+import time
+
+_T_START = time.perf_counter()
+
+import argparse
+import json
+import sys
+
+from CAM_Interface import CAM_Interface
+from CAM_methods import CAM_structures
+
+'''
+Command line entry point for batch G-code generation from parameter files (JSON).
+
+    python cli.py job.json [job2.json ...] [-o out.gcode] [-e gzip] [--validate] [--loops] [--upload] [--timing]
+
+Parameter file:
+    {
+        "properties": {"nozzle_diameter": 0.4, "filament_diameter": 1.75, "layer_width": 0.45,
+                       "layer_height": 0.2, "t0_temp": 200, "bed_temp": 60, "simulation": true},
+        "output": "aperture.gcode",
+        "encoding": "plain",
+        "jobs": [
+            {"method": "abs_move", "x": 10, "y": 10, "z": 0.2, "f": 1200},
+            {"method": "square_aperture", "outer": 10, "inner": 2, "overlap": 0.25}
+        ]
+    }
+
+"method" is a method of CAM_structures or a public method of CAM_Interface, all other keys are passed as
+keyword arguments. Only NumPy-free modules are imported at start. Network client (upload), clipboard,
+validator, encoders and loop compression are loaded when used. Startup time can be checked with --timing or
+python -X importtime cli.py ...
+'''
+
+DEFAULT_PROPERTIES = {'start_tool': 0, 'backlash': 0, 't0_temp': 0, 'bed_temp': 0}
+
+
+def load_parameters(filename: str) -> dict:
+    """
+    Reads parameter file (JSON).
+
+    :param filename: path of parameter file
+    :return: dict of parameters
+    """
+    with open(filename) as f:
+        return json.load(f)
+
+
+def build_job(params: dict) -> CAM_Interface:
+    """
+    Creates CAM_Interface with given properties and executes all jobs.
+
+    :param params: dict with 'properties' and 'jobs', see module docstring
+    :return: CAM_Interface with generated script
+    """
+    properties = dict(DEFAULT_PROPERTIES)
+    properties.update(params.get('properties', {}))
+    interface = CAM_Interface(**properties)
+    structures = CAM_structures(interface)
+    for i, job in enumerate(params.get('jobs', [])):
+        job = dict(job)
+        name = job.pop('method')
+        if hasattr(structures, name) and not name.startswith('_'):
+            method = getattr(structures, name)
+        elif hasattr(interface, name) and not name.startswith('_'):
+            method = getattr(interface, name)
+        else:
+            raise ValueError(f"Job {i:d}: method {name:s} does not exist!")
+        method(**job)
+    if params.get('end_code', True):
+        interface._add_end_code()
+    return interface
+
+
+def run(params: dict, output=None, encoding=None, validate=False, upload=False, loops=False):
+    """
+    Generates G-code for one parameter set and saves (or uploads) it.
+
+    :param params: dict of parameters, see module docstring
+    :param output: output filename. Overrides 'output' of parameters
+    :param encoding: encoding of output. Overrides 'encoding' of parameters
+    :param validate: validate script against 'machine_limits' before saving, raises ValueError on violation
+    :param upload: upload script instead of saving
+    :param loops: replace repeated move blocks by klipper macro loops (saved as <output>.cfg), see gcode_loops
+    :return: CAM_Interface with generated script
+    """
+    interface = build_job(params)
+    output = output or params.get('output', 'out.gcode')
+    encoding = encoding or params.get('encoding', 'plain')
+    if validate:
+        report = interface.validate_script()
+        if not report.ok:
+            raise ValueError(f"Validation of {output:s} failed\n{report}")
+    if upload:
+        interface.upload_script(output, encoding)
+    else:
+        interface.save_script(output, encoding, loops or params.get('loops', False))
+    return interface
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate G-code from parameter files.")
+    parser.add_argument('params', nargs='+', help="parameter file(s) (JSON)")
+    parser.add_argument('-o', '--output', help="output file. Only for single parameter file")
+    parser.add_argument('-e', '--encoding', choices=('plain', 'gzip', 'meatpack', 'bgcode'),
+                        help="encoding of output file (uploads only plain)")
+    parser.add_argument('--validate', action='store_true', help="validate against 'machine_limits'")
+    parser.add_argument('--loops', action='store_true', help="compress repeated moves into klipper macro loops")
+    parser.add_argument('--upload', action='store_true', help="upload script instead of saving")
+    parser.add_argument('--timing', action='store_true', help="print startup and generation time")
+    args = parser.parse_args(argv)
+    if args.output and len(args.params) > 1:
+        parser.error("--output only possible with single parameter file")
+    t_ready = time.perf_counter()
+    for filename in args.params:
+        run(load_parameters(filename), args.output, args.encoding, args.validate, args.upload, args.loops)
+    if args.timing:
+        t_end = time.perf_counter()
+        print(f"Startup:\t {(t_ready - _T_START) * 1e3:.1f} ms (imports and argument parsing)\n"
+              f"Generation:\t {(t_end - t_ready) * 1e3:.1f} ms for {len(args.params):d} file(s)\n"
+              f"Modules:\t {', '.join(m for m in ('numpy', 'requests', 'pyperclip') if m in sys.modules) or '-'}"
+              f" loaded")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
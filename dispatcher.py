@@ -0,0 +1,248 @@
+import itertools
+import queue
+import threading
+import time
+
+import requests
+
+from moonraker import Moonraker
+
+'''
+Dispatcher for a printer farm. Jobs (G-code scripts) are put into one priority queue and distributed over a pool
+of moonraker clients: every printer has a worker thread, which takes the next job as soon as the printer reports
+idle state, uploads it and starts the print. Uploads to different printers run concurrently.
+
+    dispatcher = Dispatcher({'p1': ('http://192.168.0.11', 7125), 'p2': ('http://192.168.0.12', 7125)})
+    dispatcher.submit(interface, 'aperture.gcode', priority=0)
+    dispatcher.start()
+    dispatcher.join(timeout=3600)
+    print(dispatcher)
+
+Per printer throughput of uploads and queue latency (time from submit to assignment) are collected in metrics().
+Transient failures (connection errors, print not started because printer became busy) put the job back into the
+queue with its original position, up to max_retries times.
+For tests several fake_moonraker.FakeMoonraker servers can be used as printers.
+'''
+
+# Zustände von print_stats, in denen ein neuer Druck gestartet werden kann
+IDLE_STATES = ('standby', 'complete', 'cancelled')
+
+
+class TransientError(Exception):
+    """
+    Failure of job, which another (or the same) printer may not have, e.g. printer became busy during upload.
+    """
+    pass
+
+
+class PrintJob:
+
+    def __init__(self, script, filename: str, priority=0, start_print=True):
+        """
+        Job of dispatcher.
+
+        :param script: G-code script (str or bytes) or CAM_Interface
+        :param filename: filename on printer
+        :param priority: lower value is dispatched first. Jobs with equal priority in order of submit
+        :param start_print: start print after upload
+        """
+        self.script = script.get_script() if hasattr(script, 'get_script') else script
+        self.filename = filename
+        self.priority = priority
+        self.start_print = start_print
+        self.printer = None
+        self.error = None
+        self.attempts = 0
+        self.submitted = time.monotonic()
+        self.assigned = None
+        self.finished = None
+        self.done = threading.Event()
+
+    def __len__(self):
+        return len(self.script.encode('utf-8') if isinstance(self.script, str) else self.script)
+
+    def __repr__(self):
+        state = 'failed' if self.error else 'done' if self.done.is_set() else 'queued' if self.printer is None \
+            else 'uploading'
+        return f"PrintJob({self.filename!r}, priority={self.priority}, printer={self.printer!r}, {state})"
+
+    def wait(self, timeout=None) -> bool:
+        """
+        Waits until job is uploaded (or failed).
+
+        :return: False on timeout
+        """
+        return self.done.wait(timeout)
+
+
+class Dispatcher:
+
+    def __init__(self, printers: dict, poll_interval=1., max_retries=3):
+        """
+        Constructor of dispatcher. Workers are started with start().
+
+        :param printers: dict of printer name and (url, port) or Moonraker object
+        :param poll_interval: interval of state requests to printers in s
+        :param max_retries: number of times a job is queued again after transient failures
+        """
+        self._printers = {name: printer if isinstance(printer, Moonraker)
+                          else Moonraker(*printer, emergency_stop_on_del=False)
+                          for name, printer in printers.items()}
+        self._poll_interval = poll_interval
+        self._max_retries = max_retries
+        self._queue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._metrics = {name: {'jobs': 0, 'failed': 0, 'retried': 0, 'bytes': 0, 'upload_time': 0., 'latencies': []}
+                         for name in self._printers}
+        self.jobs = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
+
+    def submit(self, script, filename: str, priority=0, start_print=True) -> PrintJob:
+        """
+        Puts job into queue.
+
+        :param script: G-code script (str or bytes) or CAM_Interface
+        :param filename: filename on printer
+        :param priority: lower value is dispatched first
+        :param start_print: start print after upload
+        :return: PrintJob
+        """
+        job = PrintJob(script, filename, priority, start_print)
+        self.jobs.append(job)
+        # Zähler als zweites Element: FIFO bei gleicher Priorität, Jobs werden nie verglichen
+        self._queue.put((priority, next(self._counter), job))
+        return job
+
+    def start(self):
+        """
+        Starts one worker thread per printer.
+        """
+        self._stop.clear()
+        for name in self._printers:
+            thread = threading.Thread(target=self._work, args=(name,), name=f"Dispatcher-{name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def join(self, timeout=None) -> bool:
+        """
+        Blocks until all submitted jobs are uploaded (or failed). Jobs queued again after transient failures
+        count as unfinished. Without running workers (before start() or after shutdown()) queued jobs are never
+        processed, so join() does not block then and only reports the current state.
+
+        :param timeout: timeout in s. None waits until all jobs are finished
+        :return: True if all jobs are finished, False on timeout (or unfinished jobs without workers)
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for job in list(self.jobs):
+            # In Schritten von poll_interval warten, damit shutdown() aus anderem Thread erkannt wird
+            while not job.wait(self._poll_interval if deadline is None
+                               else min(self._poll_interval, max(deadline - time.monotonic(), 0.))):
+                if not self._threads or (deadline is not None and time.monotonic() >= deadline):
+                    return False
+        return True
+
+    def shutdown(self):
+        """
+        Stops workers after their current upload. Queued jobs remain in queue.
+        """
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _is_idle(self, name: str) -> bool:
+        """
+        Requests state of printer. Unreachable printers are not idle.
+        """
+        try:
+            klippy, job = self._printers[name].get_state()
+        except Exception as e:
+            print(f"\tDispatcher:\t {name:s} not reachable: {e}")
+            return False
+        return klippy == 'ready' and job in IDLE_STATES
+
+    def _work(self, name: str):
+        """
+        Worker of printer: waits for idle state, takes next job, uploads it and starts print.
+        """
+        printer = self._printers[name]
+        while not self._stop.is_set():
+            if not self._is_idle(name):
+                self._stop.wait(self._poll_interval)
+                continue
+            try:
+                entry = self._queue.get(timeout=self._poll_interval)
+            except queue.Empty:
+                continue
+            job = entry[2]
+            job.printer = name
+            job.assigned = time.monotonic()
+            job.attempts += 1
+            t0 = time.perf_counter()
+            try:
+                try:
+                    response = printer.upload_code(job.filename, job.script, start_print=job.start_print)
+                except requests.RequestException as e:
+                    raise TransientError(e)
+                if job.start_print and not response.get('print_started', False):
+                    raise TransientError(f"Print of {job.filename} not started (printer busy)")
+            except TransientError as e:
+                if job.attempts <= self._max_retries:
+                    print(f"\tDispatcher:\t Job {job.filename} on {name:s} queued again: {e}")
+                    with self._lock:
+                        self._metrics[name]['retried'] += 1
+                    job.printer = None
+                    # Ursprüngliche Priorität und Reihenfolge
+                    self._queue.put(entry)
+                    self._queue.task_done()
+                    continue
+                job.error = e
+                print(f"\tDispatcher:\t Job {job.filename} failed on {name:s}: {e}")
+            except Exception as e:
+                job.error = e
+                print(f"\tDispatcher:\t Job {job.filename} failed on {name:s}: {e}")
+            upload_time = time.perf_counter() - t0
+            job.finished = time.monotonic()
+            with self._lock:
+                metrics = self._metrics[name]
+                metrics['failed' if job.error else 'jobs'] += 1
+                metrics['latencies'].append(job.assigned - job.submitted)
+                if not job.error:
+                    metrics['bytes'] += len(job)
+                    metrics['upload_time'] += upload_time
+            job.done.set()
+            self._queue.task_done()
+
+    def metrics(self) -> dict:
+        """
+        Returns metrics per printer: number of jobs (successful/failed/queued again), uploaded bytes, upload
+        throughput in bytes/s and mean/max queue latency (submit -> assignment) in s.
+        """
+        with self._lock:
+            result = {}
+            for name, m in self._metrics.items():
+                latencies = m['latencies']
+                result[name] = {'jobs': m['jobs'], 'failed': m['failed'], 'retried': m['retried'],
+                                'bytes': m['bytes'],
+                                'throughput': m['bytes'] / m['upload_time'] if m['upload_time'] > 0 else 0.,
+                                'mean_latency': sum(latencies) / len(latencies) if latencies else 0.,
+                                'max_latency': max(latencies, default=0.)}
+            return result
+
+    def __str__(self):
+        lines = [f"{'Printer':<12s}{'Jobs':>6s}{'Failed':>8s}{'Retried':>9s}{'MB':>10s}{'MB/s':>10s}"
+                 f"{'Latency':>10s}{'Max':>10s}"]
+        for name, m in self.metrics().items():
+            lines.append(f"{name:<12s}{m['jobs']:>6d}{m['failed']:>8d}{m['retried']:>9d}"
+                         f"{m['bytes'] / 1e6:>10.3f}{m['throughput'] / 1e6:>10.2f}"
+                         f"{m['mean_latency']:>9.2f}s{m['max_latency']:>9.2f}s")
+        return '\n'.join(lines)
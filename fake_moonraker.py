@@ -0,0 +1,362 @@
+import asyncio
+import json
+import threading
+import time
+
+from aiohttp import web
+
+'''
+Local fake of moonraker API for testing without printer. Serves HTTP requests and JSON-RPC via websocket on
+the same port, like moonraker does. Moves (G0/G1 in G90/G91) are simulated in real time, live position and
+idle_timeout state are sent as notify_status_update to all subscribers, M400 is answered after all queued moves
+are executed. Uploaded files are kept in memory and can be printed (print_stats: standby -> printing -> complete).
+
+Usage (asyncio):
+    server = FakeMoonraker()
+    await server.start()
+    ... moonraker.MoonrakerSubscription(server.url) ...
+    await server.stop()
+
+Usage (blocking code, e.g. moonraker.Moonraker):
+    with FakeMoonraker().run_in_thread() as server:
+        m = moonraker.Moonraker(server.url, server.port)
+'''
+
+
+class FakeMoonraker:
+
+    def __init__(self, host='127.0.0.1', port=0, interval=.01, time_scale=1.):
+        """
+        Constructor of fake server. Server is started with start() or run_in_thread().
+
+        :param host: Host to bind to. Default is 127.0.0.1
+        :param port: Port to bind to. Default 0 -> free port chosen by OS
+        :param interval: Interval of status notifications in s (moonraker default is .25)
+        :param time_scale: Factor for duration of simulated moves. 0 -> moves finish immediately
+        """
+        self._host = host
+        self.port = port
+        self._interval = interval
+        self._time_scale = time_scale
+        self._runner = None
+        self._loop = None
+        self._thread = None
+        self._tasks = []
+        self._clients = {}
+        self._moves = None
+        self._inc_mode = False
+        self._feedrate = 3000.
+        self._start_time = time.monotonic()
+        self.gcode_log = []
+        self.files = {}
+        self.emergency_stop = False
+        self.status = {
+            'toolhead': {'position': [0., 0., 0., 0.], 'homed_axes': 'xyz', 'print_time': 0.,
+                         'estimated_print_time': 0.},
+            'motion_report': {'live_position': [0., 0., 0., 0.], 'live_velocity': 0.},
+            'idle_timeout': {'state': 'Ready', 'printing_time': 0.},
+            'print_stats': {'filename': '', 'state': 'standby', 'print_duration': 0.},
+        }
+
+    @property
+    def url(self):
+        return f"http://{self._host}"
+
+    # Server Start/Stop #
+    async def start(self):
+        """
+        Starts HTTP/websocket server and motion simulation in running event loop.
+        """
+        self._moves = asyncio.Queue()
+        app = web.Application()
+        app.add_routes([web.get('/websocket', self._handle_websocket),
+                        web.get('/printer/info', self._handle_info),
+                        web.get('/printer/objects/query', self._handle_query),
+                        web.post('/printer/gcode/script', self._handle_gcode),
+                        web.post('/printer/print/start', self._handle_print_start),
+                        web.post('/server/files/upload', self._handle_upload),
+                        web.post('/printer/emergency_stop', self._handle_emergency_stop)])
+        self._add_routes(app)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self._host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._motion()), loop.create_task(self._notify())]
+        return self
+
+    def _add_routes(self, app):
+        """
+        Hook for additional routes.
+        """
+        pass
+
+    async def stop(self):
+        """
+        Stops server and simulation.
+        """
+        for task in self._tasks:
+            task.cancel()
+        for ws in list(self._clients):
+            await ws.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def run_in_thread(self):
+        """
+        Starts server with own event loop in background thread. Can be used as context manager.
+        """
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.stop())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name='FakeMoonraker', daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop_thread(self):
+        """
+        Stops server started with run_in_thread().
+        """
+        if self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop_thread()
+
+    # Simulation #
+    def _eventtime(self):
+        return time.monotonic() - self._start_time
+
+    def run_g_code(self, script: str):
+        """
+        Processes G-code script like klipper. Moves are queued for simulation.
+
+        :param script: one or more lines of G-code
+        :return: True if script contains M400 (caller has to wait for queued moves)
+        """
+        wait = False
+        for line in script.splitlines():
+            line = line.split(';')[0].strip().upper()
+            if not line:
+                continue
+            self.gcode_log.append(line)
+            words = line.replace(' ', '')
+            if words.startswith('G90'):
+                self._inc_mode = False
+            elif words.startswith('G91'):
+                self._inc_mode = True
+            elif words.startswith(('G1', 'G0')):
+                self._queue_move(self._parse_words(words[2:]))
+            elif words.startswith('M400'):
+                wait = True
+            elif words.startswith('M112'):
+                self.emergency_stop = True
+        return wait
+
+    def start_print(self, filename: str):
+        """
+        Starts print of uploaded file.
+
+        :param filename: filename of uploaded file
+        """
+        if filename not in self.files:
+            raise Exception(f"File {filename} does not exist")
+        if self.status['print_stats']['state'] in ('printing', 'paused'):
+            raise Exception("Printer is busy")
+        self.status['print_stats'].update(filename=filename, state='printing', print_duration=0.)
+        self.run_g_code(self.files[filename].decode('utf-8'))
+        if self._moves.empty() and self.status['idle_timeout']['state'] != 'Printing':
+            self.status['print_stats']['state'] = 'complete'
+
+    @staticmethod
+    def _parse_words(words: str):
+        """
+        Splits parameters of G-code command (X10.0Y-2F300) into dict.
+        """
+        params = {}
+        key, value = None, ''
+        for c in words + 'Q':
+            if c.isalpha():
+                if key is not None and value:
+                    params[key] = float(value)
+                key, value = c, ''
+            else:
+                value += c
+        return params
+
+    def _queue_move(self, params: dict):
+        """
+        Updates commanded position and queues move for simulation.
+        """
+        if 'F' in params:
+            self._feedrate = params['F']
+        start = list(self.status['toolhead']['position'])
+        target = list(start)
+        for i, axis in enumerate('XYZE'):
+            if axis in params:
+                target[i] = target[i] + params[axis] if self._inc_mode or axis == 'E' else params[axis]
+        self.status['toolhead']['position'] = target
+        self.status['idle_timeout']['state'] = 'Printing'
+        dist = sum((a - b) ** 2 for a, b in zip(start[:3], target[:3])) ** .5
+        duration = dist / (self._feedrate / 60) * self._time_scale if self._feedrate > 0 else 0.
+        self.status['toolhead']['print_time'] += duration
+        self._moves.put_nowait((start, target, duration))
+
+    async def _motion(self):
+        """
+        Executes queued moves and interpolates live position.
+        """
+        while True:
+            start, target, duration = await self._moves.get()
+            t0 = time.monotonic()
+            while True:
+                t = time.monotonic() - t0
+                if t >= duration:
+                    break
+                f = t / duration
+                self.status['motion_report']['live_position'] = [a + f * (b - a) for a, b in zip(start, target)]
+                self.status['motion_report']['live_velocity'] = self._feedrate / 60
+                await asyncio.sleep(min(self._interval, duration - t))
+            self.status['motion_report']['live_position'] = list(target)
+            self.status['motion_report']['live_velocity'] = 0.
+            if self._moves.empty():
+                self.status['idle_timeout']['state'] = 'Ready'
+                if self.status['print_stats']['state'] == 'printing':
+                    self.status['print_stats']['state'] = 'complete'
+            self._moves.task_done()
+
+    async def _notify(self):
+        """
+        Sends changed fields of subscribed objects to every client in given interval.
+        """
+        while True:
+            await asyncio.sleep(self._interval)
+            self.status['toolhead']['estimated_print_time'] = self._eventtime()
+            for ws, (objects, last) in list(self._clients.items()):
+                diff = {}
+                for obj, fields in self._select(objects).items():
+                    changed = {k: v for k, v in fields.items() if last.get(obj, {}).get(k) != v}
+                    if changed:
+                        diff[obj] = changed
+                        last.setdefault(obj, {}).update(json.loads(json.dumps(changed)))
+                if diff:
+                    try:
+                        await ws.send_json({'jsonrpc': '2.0', 'method': 'notify_status_update',
+                                            'params': [diff, self._eventtime()]})
+                    except ConnectionError:
+                        self._clients.pop(ws, None)
+
+    def _select(self, objects: dict):
+        """
+        Returns requested objects/fields of status. None as field list selects all fields.
+        """
+        selected = {}
+        for obj, fields in objects.items():
+            if obj not in self.status:
+                continue
+            status = self.status[obj]
+            selected[obj] = {k: v for k, v in status.items() if not fields or k in fields}
+        return json.loads(json.dumps(selected))
+
+    def _info(self):
+        return {'state': 'ready', 'state_message': 'Printer is ready (fake)', 'hostname': 'fake-moonraker',
+                'software_version': 'fake'}
+
+    # JSON-RPC via websocket #
+    async def _handle_websocket(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self._clients[ws] = ({}, {})
+        try:
+            async for msg in ws:
+                data = json.loads(msg.data)
+                response = {'jsonrpc': '2.0', 'id': data.get('id')}
+                try:
+                    response['result'] = await self._rpc(ws, data['method'], data.get('params', {}))
+                except Exception as e:
+                    response['error'] = {'code': 400, 'message': str(e)}
+                await ws.send_json(response)
+        finally:
+            self._clients.pop(ws, None)
+        return ws
+
+    async def _rpc(self, ws, method: str, params: dict):
+        """
+        Handles JSON-RPC methods of moonraker, which are supported by fake.
+        """
+        if method == 'printer.objects.subscribe':
+            objects = params.get('objects', {})
+            status = self._select(objects)
+            self._clients[ws] = (objects, json.loads(json.dumps(status)))
+            return {'eventtime': self._eventtime(), 'status': status}
+        if method == 'printer.objects.query':
+            return {'eventtime': self._eventtime(), 'status': self._select(params.get('objects', {}))}
+        if method == 'printer.gcode.script':
+            if self.run_g_code(params['script']):
+                # M400: Antwort erst nach Ausführung aller Bewegungen
+                await self._moves.join()
+            return 'ok'
+        if method == 'printer.info':
+            return self._info()
+        if method == 'printer.print.start':
+            self.start_print(params['filename'])
+            return 'ok'
+        if method == 'printer.emergency_stop':
+            self.emergency_stop = True
+            return 'ok'
+        raise Exception(f"Method not found: {method}")
+
+    # HTTP #
+    async def _handle_info(self, request):
+        return web.json_response({'result': self._info()})
+
+    async def _handle_query(self, request):
+        objects = {k: v.split(',') if v else None for k, v in request.query.items()}
+        return web.json_response({'result': {'eventtime': self._eventtime(), 'status': self._select(objects)}})
+
+    async def _handle_gcode(self, request):
+        if self.run_g_code(request.query.get('script', '')):
+            await self._moves.join()
+        return web.json_response({'result': 'ok'})
+
+    async def _handle_emergency_stop(self, request):
+        self.emergency_stop = True
+        return web.json_response({'result': 'ok'})
+
+    async def _handle_print_start(self, request):
+        try:
+            self.start_print(request.query.get('filename', ''))
+        except Exception as e:
+            return web.json_response({'error': {'code': 400, 'message': str(e)}}, status=400)
+        return web.json_response({'result': 'ok'})
+
+    async def _handle_upload(self, request):
+        form = await request.post()
+        upload = form['file']
+        filename = upload.filename
+        self.files[filename] = upload.file.read()
+        print_started = form.get('print', 'false') == 'true'
+        if print_started:
+            try:
+                self.start_print(filename)
+            except Exception:
+                print_started = False
+        return web.json_response({'result': {'item': {'path': filename, 'root': form.get('root', 'gcodes'),
+                                                      'size': len(self.files[filename])},
+                                             'print_started': print_started, 'print_queued': False,
+                                             'action': 'create_file'}}, status=201)
@@ -0,0 +1,116 @@
+import re
+
+import numpy as np
+
+from toolpath import Toolpath, parse_gcode
+
+"""
+Volumetric flow aware feedrate planning. For every printing move the fastest feedrate is computed, which
+respects the max. volumetric flow of the hotend (given the extrusion cross-section of the move) and the
+machine speed limits. F values of the script are rewritten accordingly, such that wide/thin lines are
+printed as fast as physically possible instead of with one conservative feedrate.
+
+The extrude factor (M221) is applied to the extrusion of the toolpath (see toolpath.parse_gcode), such that the
+flow limit holds for the overridden extrusion. Speed factor override (M220) is not taken into account.
+"""
+
+_F_WORD = re.compile(r'F\s*[-+]?[0-9]*\.?[0-9]+', re.IGNORECASE)
+
+
+def plan(toolpath: Toolpath, filament_diameter: float, max_flow=None, max_feedrate=None, axis_limits=None,
+         min_feedrate=None, travel_feedrate=None):
+    """
+    Fastest feedrate of every move within limits.
+
+    :param toolpath: Toolpath object
+    :param filament_diameter: filament diameter in mm
+    :param max_flow: max. volumetric flow in mm³/s
+    :param max_feedrate: max. feedrate of toolhead in mm/min
+    :param axis_limits: dict of max. feedrate per axis in mm/min, keys 'x', 'y', 'z', 'e'
+    :param min_feedrate: lower limit for printing moves in mm/min (max_flow may be exceeded then)
+    :param travel_feedrate: feedrate of travel moves in mm/min. Default keeps programmed feedrate
+    :return: (n,) array of feedrates in mm/min
+    """
+    axis_limits = axis_limits or {}
+    delta = toolpath.end - toolpath.start
+    length = np.linalg.norm(delta, axis=1)
+    e = toolpath.e
+    printing = toolpath.is_extrusion()
+    # Bewegungen ohne bekannten Vorschub fahren mit max_feedrate
+    fallback = max_feedrate if max_feedrate is not None else np.inf
+    f = np.where(toolpath.f > 0, toolpath.f, fallback)
+    if travel_feedrate is not None:
+        f = np.where(printing, f, travel_feedrate)
+    limit = np.full(len(toolpath), np.inf)
+    if max_flow is not None:
+        area = np.pi * filament_diameter ** 2 / 4
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Q = A_F * E / L * v  ->  v = Q * L / (A_F * E)
+            flow_limit = max_flow * length / (area * e) * 60
+        limit = np.where(printing, flow_limit, limit)
+        # Reines Extrudieren: Vorschub ist Extrudergeschwindigkeit
+        limit = np.where((length == 0) & (e > 0), max_flow / area * 60, limit)
+    if max_feedrate is not None:
+        limit = np.minimum(limit, max_feedrate)
+    # Achslimits: Anteil der Achse an Bahngeschwindigkeit (Extruder bezogen auf Bahnlänge)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i, axis in enumerate('xyz'):
+            if axis in axis_limits:
+                ratio = np.abs(delta[:, i]) / length
+                limit = np.minimum(limit, np.where(ratio > 0, axis_limits[axis] / ratio, np.inf))
+        if 'e' in axis_limits:
+            ratio = np.where(length > 0, np.abs(e) / length, 1.)
+            limit = np.minimum(limit, np.where(ratio > 0, axis_limits['e'] / ratio, np.inf))
+    planned = np.where(printing, limit, np.minimum(f, limit))
+    if min_feedrate is not None:
+        planned = np.where(printing, np.maximum(planned, min_feedrate), planned)
+    if np.any(~np.isfinite(planned)):
+        raise ValueError("Feedrate not limited for some moves. Set max_feedrate")
+    return planned
+
+
+def rewrite(script: str, toolpath: Toolpath, feedrates, coalesce=60.):
+    """
+    Rewrites F values of all moves. Feedrate-only lines (G1F...) are removed, because F is set on the moves.
+
+    :param script: G-code script the toolpath was parsed from
+    :param toolpath: Toolpath object of script
+    :param feedrates: (n,) array of new feedrates in mm/min
+    :param coalesce: feedrates are rounded down to multiples of this step (mm/min) and only written on change.
+                     None writes F on every move
+    :return: new G-code script
+    """
+    feedrates = np.asarray(feedrates, dtype=float)
+    if coalesce:
+        # Abrunden: gemeinsamer Wert überschreitet nie das Limit einer Bewegung
+        rounded = np.floor(feedrates / coalesce) * coalesce
+        feedrates = np.where(rounded > 0, rounded, feedrates)
+        emit = np.ones(len(feedrates), dtype=bool)
+        emit[1:] = feedrates[1:] != feedrates[:-1]
+    else:
+        emit = np.ones(len(feedrates), dtype=bool)
+    lines = script.split('\n')
+    for i, feedrate in zip(toolpath.line[emit], feedrates[emit]):
+        code, sep, comment = lines[i].partition(';')
+        lines[i] = f"{_F_WORD.sub('', code).rstrip()}F{feedrate:.3f}{' ' if sep else ''}{sep}{comment}"
+    for i in toolpath.line[~emit]:
+        code, sep, comment = lines[i].partition(';')
+        lines[i] = f"{_F_WORD.sub('', code).rstrip()}{' ' if sep else ''}{sep}{comment}"
+    for i in toolpath.feed_lines:
+        code, sep, comment = lines[i].partition(';')
+        lines[i] = f"{sep}{comment}" if sep else None
+    return '\n'.join(line for line in lines if line is not None)
+
+
+def plan_feedrates(script: str, filament_diameter: float, coalesce=60., **limits) -> str:
+    """
+    Plans and rewrites feedrates of G-code script.
+
+    :param script: G-code script
+    :param filament_diameter: filament diameter in mm
+    :param coalesce: rounding step in mm/min, see rewrite()
+    :param limits: max_flow, max_feedrate, axis_limits, min_feedrate, travel_feedrate, see plan()
+    :return: new G-code script
+    """
+    toolpath = parse_gcode(script)
+    return rewrite(script, toolpath, plan(toolpath, filament_diameter, **limits), coalesce)
@@ -0,0 +1,342 @@
+import gzip
+import io
+import re
+import struct
+import time
+import zlib
+
+import numpy as np
+
+"""
+Compact encodings of G-code scripts for faster transfer to the printer host.
+
+    plain:    ASCII text as written by CAM_Interface
+    gzip:     gzip stream of the text (lossless)
+    meatpack: MeatPack packing (4 bit per character for 0-9 . space/E newline G X), applied to minified G-code
+              (comments and spaces in classic G/M commands removed, except message text of M117/M118)
+    bgcode:   binary G-code container (file header, metadata blocks and G-code blocks with CRC32, deflate
+              compressed) following the layout of libbgcode (https://github.com/prusa3d/libbgcode)
+
+Every encoding has a decoder, such that round trips can be checked with decode(encode(script)).
+klipper prints plain G-code only, the other encodings are transfer and archive formats (decode before printing).
+"""
+
+ENCODINGS = ('plain', 'gzip', 'meatpack', 'bgcode')
+EXTENSIONS = {'plain': '.gcode', 'gzip': '.gcode.gz', 'meatpack': '.gcode.mp', 'bgcode': '.bgcode'}
+
+# MeatPack
+# Zeichen -> 4-Bit Code, 0b1111 kennzeichnet ein nachfolgendes, ungepacktes Zeichen
+_MP_TABLE = '0123456789. \nGX'
+_MP_TABLE_NO_SPACES = '0123456789.E\nGX'
+_MP_FULL_WIDTH = 0b1111
+_MP_SIGNAL = b'\xff\xff'
+_MP_ENABLE_PACKING = 0xFB
+_MP_DISABLE_PACKING = 0xFA
+_MP_RESET_ALL = 0xF9
+_MP_ENABLE_NO_SPACES = 0xF7
+_MP_DISABLE_NO_SPACES = 0xF6
+# Befehle mit Meldungstext, dessen Leerzeichen erhalten bleiben
+_MESSAGE = re.compile(r'^M11[78](?!\d)', re.IGNORECASE)
+
+# Binary G-code
+_BG_MAGIC = b'GCDE'
+_BG_VERSION = 1
+_BG_CHECKSUM_CRC32 = 1
+_BG_FILE_METADATA, _BG_GCODE, _BG_SLICER_METADATA, _BG_PRINTER_METADATA, _BG_PRINT_METADATA = 0, 1, 2, 3, 4
+_BG_COMPRESSION_NONE, _BG_COMPRESSION_DEFLATE = 0, 1
+_BG_ENCODING_INI = 0
+_BG_GCODE_PLAIN, _BG_GCODE_MEATPACK = 0, 1
+_BG_BLOCK_SIZE = 65535
+
+
+def encode(script: str, encoding='plain', **kwargs) -> bytes:
+    """
+    Encodes G-code script.
+
+    :param script: G-code script
+    :param encoding: one of ENCODINGS
+    :param kwargs: options of encoder (gzip: level, bgcode: metadata, meatpack)
+    :return: encoded bytes
+    """
+    if encoding == 'plain':
+        return script.encode('utf-8')
+    if encoding == 'gzip':
+        return gzip.compress(script.encode('utf-8'), compresslevel=kwargs.get('level', 6), mtime=0)
+    if encoding == 'meatpack':
+        return meatpack(script)
+    if encoding == 'bgcode':
+        return bgcode(script, **kwargs)
+    raise ValueError(f"Encoding {encoding:s} does not exist! Use one of {', '.join(ENCODINGS)}")
+
+
+def decode(data: bytes, encoding='plain') -> str:
+    """
+    Decodes G-code encoded with encode().
+
+    :param data: encoded bytes
+    :param encoding: one of ENCODINGS
+    :return: G-code script (minified for meatpack)
+    """
+    if encoding == 'plain':
+        return data.decode('utf-8')
+    if encoding == 'gzip':
+        return gzip.decompress(data).decode('utf-8')
+    if encoding == 'meatpack':
+        return unmeatpack(data)
+    if encoding == 'bgcode':
+        return unbgcode(data)[0]
+    raise ValueError(f"Encoding {encoding:s} does not exist! Use one of {', '.join(ENCODINGS)}")
+
+
+def write(script, f, encoding='plain', chunk_size=1 << 20, **kwargs):
+    """
+    Writes encoded G-code script to binary file object. Plain and gzip are written in chunks, such that the
+    encoded script is never held in memory as a whole.
+
+    :param script: G-code script (str or StringIO)
+    :param f: file object opened in binary mode
+    :param encoding: one of ENCODINGS
+    :param chunk_size: size of chunks in characters
+    :param kwargs: options of encoder
+    :return: number of written bytes
+    """
+    if isinstance(script, io.StringIO):
+        script = script.getvalue()
+    if encoding in ('plain', 'gzip'):
+        # Position vor dem gzip Header, GzipFile schreibt ihn schon im Konstruktor
+        start = f.tell()
+        out = gzip.GzipFile(fileobj=f, mode='wb', compresslevel=kwargs.get('level', 6), mtime=0) \
+            if encoding == 'gzip' else f
+        for i in range(0, len(script), chunk_size):
+            out.write(script[i:i + chunk_size].encode('utf-8'))
+        if out is not f:
+            out.close()
+        return f.tell() - start
+    return f.write(encode(script, encoding, **kwargs))
+
+
+# MeatPack #
+def minify(script: str, no_spaces=True) -> str:
+    """
+    Removes comments, empty lines and surrounding whitespace. With no_spaces spaces in classic G/M/T commands
+    are removed as well (klipper extended commands like FORCE_MOVE and messages of M117/M118 keep their spaces).
+
+    :param script: G-code script
+    :param no_spaces: remove spaces in classic commands
+    :return: minified script, every line terminated with newline
+    """
+    lines = []
+    for line in script.splitlines():
+        line = line.split(';', 1)[0].strip()
+        if not line:
+            continue
+        if no_spaces and line[0] in 'GMTgmt' and len(line) > 1 and line[1].isdigit() and not _MESSAGE.match(line):
+            line = line.replace(' ', '')
+        lines.append(line)
+    return '\n'.join(lines) + '\n' if lines else ''
+
+
+def meatpack(script: str, no_spaces=True) -> bytes:
+    """
+    Packs minified G-code with MeatPack. Stream starts with signals for enabling packing (and no spaces mode).
+    Odd number of characters is padded with newline.
+
+    :param script: G-code script
+    :param no_spaces: use no spaces mode ('E' gets packed instead of ' ')
+    :return: packed bytes
+    """
+    text = minify(script, no_spaces).encode('utf-8')
+    if len(text) % 2:
+        text += b'\n'
+    table = _MP_TABLE_NO_SPACES if no_spaces else _MP_TABLE
+    lut = np.full(256, _MP_FULL_WIDTH, dtype=np.uint8)
+    lut[[ord(c) for c in table]] = np.arange(len(table), dtype=np.uint8)
+    chars = np.frombuffer(text, dtype=np.uint8).reshape(-1, 2)
+    codes = lut[chars]
+    full = codes == _MP_FULL_WIDTH
+    # Jedes Paar: gepacktes Byte, danach ggf. ungepackte Zeichen (erst erstes, dann zweites)
+    size = 1 + full.sum(axis=1)
+    pos = np.cumsum(size) - size
+    body = np.empty(int(size.sum()), dtype=np.uint8)
+    body[pos] = codes[:, 0] | codes[:, 1] << 4
+    body[(pos + 1)[full[:, 0]]] = chars[full[:, 0], 0]
+    body[(pos + 1 + full[:, 0])[full[:, 1]]] = chars[full[:, 1], 1]
+    out = _MP_SIGNAL + bytes([_MP_ENABLE_PACKING])
+    if no_spaces:
+        out += _MP_SIGNAL + bytes([_MP_ENABLE_NO_SPACES])
+    return out + body.tobytes()
+
+
+def unmeatpack(data: bytes) -> str:
+    """
+    Unpacks MeatPack stream like firmware does. Padding newline is removed.
+
+    :param data: packed bytes
+    :return: minified G-code script
+    """
+    out = bytearray()
+    packing, no_spaces = False, False
+    tables = {False: [ord(c) for c in _MP_TABLE], True: [ord(c) for c in _MP_TABLE_NO_SPACES]}
+    i, n = 0, len(data)
+    while i < n:
+        if data[i:i + 2] == _MP_SIGNAL:
+            cmd = data[i + 2]
+            if cmd == _MP_ENABLE_PACKING:
+                packing = True
+            elif cmd == _MP_DISABLE_PACKING:
+                packing = False
+            elif cmd == _MP_ENABLE_NO_SPACES:
+                no_spaces = True
+            elif cmd == _MP_DISABLE_NO_SPACES:
+                no_spaces = False
+            elif cmd == _MP_RESET_ALL:
+                packing, no_spaces = False, False
+            i += 3
+            continue
+        if not packing:
+            out.append(data[i])
+            i += 1
+            continue
+        table = tables[no_spaces]
+        byte = data[i]
+        i += 1
+        for code in (byte & 0xF, byte >> 4):
+            if code == _MP_FULL_WIDTH:
+                out.append(data[i])
+                i += 1
+            else:
+                out.append(table[code])
+    if out.endswith(b'\n\n'):
+        del out[-1]
+    return out.decode('utf-8')
+
+
+# Binary G-code #
+def _bg_block(block_type: int, encoding: int, payload: bytes, compress: bool) -> bytes:
+    """
+    Builds block: header, parameters (encoding), data and CRC32 of all three.
+    """
+    if compress:
+        data = zlib.compress(payload, 9)
+        header = struct.pack('<HHII', block_type, _BG_COMPRESSION_DEFLATE, len(payload), len(data))
+    else:
+        data = payload
+        header = struct.pack('<HHI', block_type, _BG_COMPRESSION_NONE, len(payload))
+    block = header + struct.pack('<H', encoding) + data
+    return block + struct.pack('<I', zlib.crc32(block))
+
+
+def _bg_ini(metadata: dict) -> bytes:
+    return ''.join(f"{key}={value}\n" for key, value in metadata.items()).encode('utf-8')
+
+
+def bgcode(script: str, metadata=None, compress=True, use_meatpack=False) -> bytes:
+    """
+    Binary G-code container. Printer, print and slicer metadata blocks followed by G-code blocks of max. 64 kB,
+    deflate compressed, each secured with CRC32.
+
+    :param script: G-code script
+    :param metadata: dict with keys 'printer', 'print', 'slicer' of dicts (key=value metadata)
+    :param compress: deflate compression of blocks
+    :param use_meatpack: pack G-code with MeatPack before compression (lossy, see minify)
+    :return: bytes of binary G-code file
+    """
+    metadata = metadata or {}
+    out = bytearray(_BG_MAGIC + struct.pack('<IH', _BG_VERSION, _BG_CHECKSUM_CRC32))
+    slicer = {'producer': 'G-Cod3r'}
+    slicer.update(metadata.get('slicer', {}))
+    for block_type, data in ((_BG_PRINTER_METADATA, metadata.get('printer', {})),
+                             (_BG_PRINT_METADATA, metadata.get('print', {})),
+                             (_BG_SLICER_METADATA, slicer)):
+        out += _bg_block(block_type, _BG_ENCODING_INI, _bg_ini(data), compress)
+    if use_meatpack:
+        payload, encoding = meatpack(script), _BG_GCODE_MEATPACK
+    else:
+        payload, encoding = script.encode('utf-8'), _BG_GCODE_PLAIN
+    for i in range(0, len(payload), _BG_BLOCK_SIZE):
+        out += _bg_block(_BG_GCODE, encoding, payload[i:i + _BG_BLOCK_SIZE], compress)
+    return bytes(out)
+
+
+def unbgcode(data: bytes):
+    """
+    Reads binary G-code container. Checksums are verified.
+
+    :param data: bytes of binary G-code file
+    :return: tupel(G-code script, metadata dict)
+    """
+    if data[:4] != _BG_MAGIC:
+        raise ValueError("No binary G-code file (magic number missing)")
+    version, checksum = struct.unpack_from('<IH', data, 4)
+    if version != _BG_VERSION:
+        raise ValueError(f"Binary G-code version {version:d} not supported")
+    names = {_BG_FILE_METADATA: 'file', _BG_PRINTER_METADATA: 'printer', _BG_PRINT_METADATA: 'print',
+             _BG_SLICER_METADATA: 'slicer'}
+    pos = 10
+    gcode, metadata = [], {}
+    gcode_encoding = _BG_GCODE_PLAIN
+    while pos < len(data):
+        block_start = pos
+        block_type, compression, size = struct.unpack_from('<HHI', data, pos)
+        pos += 8
+        compressed_size = size
+        if compression != _BG_COMPRESSION_NONE:
+            compressed_size, = struct.unpack_from('<I', data, pos)
+            pos += 4
+        encoding, = struct.unpack_from('<H', data, pos)
+        pos += 2
+        payload = data[pos:pos + compressed_size]
+        pos += compressed_size
+        if checksum == _BG_CHECKSUM_CRC32:
+            crc, = struct.unpack_from('<I', data, pos)
+            pos += 4
+            if zlib.crc32(data[block_start:pos - 4]) != crc:
+                raise ValueError(f"Checksum error in block at byte {block_start:d}")
+        if compression == _BG_COMPRESSION_DEFLATE:
+            payload = zlib.decompress(payload)
+        elif compression != _BG_COMPRESSION_NONE:
+            raise ValueError(f"Compression {compression:d} not supported")
+        if block_type == _BG_GCODE:
+            gcode.append(payload)
+            gcode_encoding = encoding
+        elif block_type in names:
+            lines = payload.decode('utf-8').splitlines()
+            metadata[names[block_type]] = dict(line.split('=', 1) for line in lines if '=' in line)
+    payload = b''.join(gcode)
+    script = unmeatpack(payload) if gcode_encoding == _BG_GCODE_MEATPACK else payload.decode('utf-8')
+    return script, metadata
+
+
+# Vergleich der Kodierungen #
+def benchmark(script: str, encodings=ENCODINGS, repeat=3, verbose=True) -> dict:
+    """
+    Measures size and encode/decode throughput of encodings for given script and checks round trip.
+
+    :param script: G-code script
+    :param encodings: encodings to compare
+    :param repeat: number of runs, best one is taken
+    :param verbose: print table to stdout
+    :return: dict of encoding and dict(size, ratio, encode_mb_s, decode_mb_s, round_trip)
+    """
+    raw = len(script.encode('utf-8'))
+    results = {}
+    for encoding in encodings:
+        t_enc, t_dec = float('inf'), float('inf')
+        for _ in range(repeat):
+            t = time.perf_counter()
+            data = encode(script, encoding)
+            t_enc = min(t_enc, time.perf_counter() - t)
+            t = time.perf_counter()
+            decoded = decode(data, encoding)
+            t_dec = min(t_dec, time.perf_counter() - t)
+        expected = minify(script) if encoding == 'meatpack' else script
+        results[encoding] = {'size': len(data), 'ratio': len(data) / raw if raw else 0.,
+                             'encode_mb_s': raw / t_enc / 1e6 if t_enc else float('inf'),
+                             'decode_mb_s': raw / t_dec / 1e6 if t_dec else float('inf'),
+                             'round_trip': decoded == expected}
+    if verbose:
+        print(f"{'encoding':<10}{'bytes':>12}{'ratio':>8}{'enc MB/s':>10}{'dec MB/s':>10}  round trip")
+        for encoding, r in results.items():
+            print(f"{encoding:<10}{r['size']:>12d}{r['ratio']:>8.3f}{r['encode_mb_s']:>10.1f}"
+                  f"{r['decode_mb_s']:>10.1f}  {'ok' if r['round_trip'] else 'FAILED'}")
+    return results
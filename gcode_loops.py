@@ -0,0 +1,289 @@
+import hashlib
+import re
+
+"""
+Loop compression of G-code scripts. Runs of repeated move blocks (typically the relative G91 blocks of
+CAM_structures.lattice or square_aperture) are replaced by the invocation of a klipper gcode_macro, which emits
+the block in a loop. Every number of the block may change by a constant step per repetition (arithmetic
+progression, e.g. the shrinking side length of square_aperture):
+
+    G1X10.000E0.338488          CAM_LOOP_FAMCCKBO N=12 P0=10.0 D0=-0.3375 P1=0.338488 D1=-0.011424 ...
+    G1Y10.000E0.338488    ->
+    G1X-9.663E0.327064
+    ...
+
+The macros are written as klipper config snippet, which has to be included in printer.cfg. Repetition i of a
+block is formatted in the macro exactly like in python ("%.3f"|format(P + i * D)), loops are only used where
+this reproduces the original lines character by character. check_round_trip() verifies this by expanding the
+compressed script again.
+"""
+
+_MOVE = re.compile(r'G[01](?:[A-Z]-?\d+(?:\.\d+)?)+')
+_NUMBER = re.compile(r'-?\d+\.(\d+)')
+_MACRO = re.compile(r'^\[gcode_macro (\S+)\]$')
+_FORMAT = re.compile(r'^\s*\{"([^"]*)"\|format\((.*)\)\}$')
+_FIELD = re.compile(r'p\[(\d+)\] \+ i \* d\[(\d+)\]')
+# Zerlegung der Befehlszeile wie klipper (gcode.py): Befehl = erste Buchstabenfolge + folgende Ziffern
+_KLIPPER_ARGS = re.compile(r'([A-Z_]+|[A-Z*])')
+_HEX_TO_LETTERS = str.maketrans('0123456789abcdef', 'ABCDEFGHIJKLMNOP')
+
+
+def _parse(line: str):
+    """
+    Splits move line into format string, numbers and their values, e.g.
+    G1X1.000E0.1 -> ('G1X%.3fE%.1f', ('1.000', '0.1'), (1.0, 0.1)). Returns None for all other lines.
+    """
+    if not _MOVE.fullmatch(line):
+        return None
+    numbers = tuple(m.group(0) for m in _NUMBER.finditer(line))
+    return _NUMBER.sub(lambda m: f"%.{len(m.group(1)):d}f", line), numbers, tuple(float(x) for x in numbers)
+
+
+def _fit(strings, decimals: int):
+    """
+    Searches start value and step, such that start + i * step is formatted like strings[i].
+
+    :return: tupel(start, step, number of matching strings from beginning)
+    """
+    h = .5 * 10. ** -decimals
+    x = [float(s) for s in strings]
+    # Notwendige Bedingung |i*d - (x_i - x_0)| < 2h liefert Intervall der Schrittweite
+    lo, hi = -float('inf'), float('inf')
+    n = len(x)
+    for i in range(1, len(x)):
+        lo_i, hi_i = (x[i] - x[0] - 2 * h) / i, (x[i] - x[0] + 2 * h) / i
+        if max(lo, lo_i) > min(hi, hi_i):
+            n = i
+            break
+        lo, hi = max(lo, lo_i), min(hi, hi_i)
+    mid = (lo + hi) / 2 if n > 1 else 0.
+    best = (x[0], 0., 1)
+    for step in (round(mid, decimals), mid):
+        # Startwert: erster Wert oder Mitte des zulässigen Intervalls
+        center = (max(x[i] - h - i * step for i in range(n)) + min(x[i] + h - i * step for i in range(n))) / 2
+        for start in (x[0], center):
+            m = 0
+            while m < n and f"%.{decimals:d}f" % (start + m * step) == strings[m]:
+                m += 1
+            if m > best[2]:
+                best = (start, step, m)
+            if m == n:
+                return best
+    return best
+
+
+def _find_loop(parsed, p: int, k: int, min_repeats: int):
+    """
+    Longest loop of block parsed[p:p+k] starting at p. Repetitions are only scanned as long as the block shape
+    matches and every number can still be an arithmetic progression, such that the effort is proportional to
+    the length of the loop (and constant, if there is none).
+
+    :return: tupel(repetitions, starts, steps) or None
+    """
+    if p + k * min_repeats > len(parsed) or any(parsed[p + j] is None for j in range(k)):
+        return None
+    shapes = [parsed[p + j][0] for j in range(k)]
+    if min_repeats >= 3:
+        # Schnelltest an den ersten drei Wiederholungen: gleiche Form, zweite Differenz innerhalb der Rundung
+        for j in range(k):
+            a, b, c = parsed[p + j], parsed[p + k + j], parsed[p + 2 * k + j]
+            if b is None or c is None or b[0] != shapes[j] or c[0] != shapes[j]:
+                return None
+            for value, x0, x1, x2 in zip(a[1], a[2], b[2], c[2]):
+                if abs(x2 - 2 * x1 + x0) > 2.01 * 10. ** (value.index('.') + 1 - len(value)):
+                    return None
+    fields = [(j, f, len(value) - value.index('.') - 1)
+              for j in range(k) for f, value in enumerate(parsed[p + j][1])]
+    x0 = [parsed[p + j][2][f] for j, f, _ in fields]
+    h = [.5 * 10. ** -decimals for _, _, decimals in fields]
+    lo, hi = [-float('inf')] * len(fields), [float('inf')] * len(fields)
+    n = 1
+    while p + (n + 1) * k <= len(parsed):
+        block = parsed[p + n * k:p + (n + 1) * k]
+        if not all(line is not None and line[0] == shape for line, shape in zip(block, shapes)):
+            break
+        # Notwendige Bedingung |n*d - (x_n - x_0)| < 2h für alle Felder
+        new_lo, new_hi = lo[:], hi[:]
+        for i, (j, f, _) in enumerate(fields):
+            x = block[j][2][f]
+            a, b = (x - x0[i] - 2 * h[i]) / n, (x - x0[i] + 2 * h[i]) / n
+            if a > new_lo[i]:
+                new_lo[i] = a
+            if b < new_hi[i]:
+                new_hi[i] = b
+            if new_lo[i] > new_hi[i]:
+                break
+        else:
+            lo, hi = new_lo, new_hi
+            n += 1
+            continue
+        break
+    if n < min_repeats:
+        return None
+    fits = []
+    for j, f, decimals in fields:
+        fit = _fit([parsed[p + i * k + j][1][f] for i in range(n)], decimals)
+        # Kürzere Schleife: Anpassungen der übrigen Felder gelten auch für den Anfang
+        n = min(n, fit[2])
+        if n < min_repeats:
+            return None
+        fits.append(fit)
+    return n, [fit[0] for fit in fits], [fit[1] for fit in fits]
+
+
+def _macro_name(shapes, prefix: str) -> str:
+    """
+    Macro name from hash of block, such that macros of different scripts can be merged into one config.
+    The hash is written with letters A-P, because klipper ends the command name at the first digit.
+    """
+    digest = hashlib.sha1(chr(10).join(shapes).encode('utf-8')).hexdigest()[:8]
+    return f"{prefix}_{digest.translate(_HEX_TO_LETTERS)}"
+
+
+def _macro(name: str, shapes) -> str:
+    """
+    Klipper gcode_macro emitting block N times.
+    """
+    n_fields = sum(shape.count('%') for shape in shapes)
+    lines = [f"[gcode_macro {name:s}]",
+             f"description: Loop of {len(shapes):d} move(s), generated by gcode_loops",
+             "gcode:",
+             f"    {{% set p = [{', '.join(f'params.P{i:d}|float' for i in range(n_fields))}] %}}",
+             f"    {{% set d = [{', '.join(f'params.D{i:d}|float' for i in range(n_fields))}] %}}",
+             "    {% for i in range(params.N|int) %}"]
+    field = 0
+    for shape in shapes:
+        args = ', '.join(f"p[{i:d}] + i * d[{i:d}]" for i in range(field, field + shape.count('%')))
+        field += shape.count('%')
+        lines.append(f'    {{"{shape:s}"|format({args:s})}}')
+    lines.append("    {% endfor %}")
+    return '\n'.join(lines) + '\n'
+
+
+def compress(script: str, min_repeats=3, max_block=8, prefix='CAM_LOOP'):
+    """
+    Replaces repeated move blocks by loop macros. Prefix must not contain digits (see _macro_name).
+    Block lengths k are only tried at lines, whose shape repeats after k and 2k lines with the first number in
+    arithmetic progression, such that scripts without loops cost about one comparison per line and block length.
+
+    :param script: G-code script
+    :param min_repeats: min. number of repetitions of a block
+    :param max_block: max. number of lines of a block
+    :param prefix: prefix of macro names
+    :return: tupel(compressed script, klipper config snippet with macro definitions)
+    """
+    if any(c.isdigit() for c in prefix):
+        raise ValueError(f"Macro prefix {prefix} must not contain digits")
+    lines = script.split('\n')
+    parsed = [_parse(line) for line in lines]
+    # Vorfilter: Form als Zahl, erster Wert und Rundungstoleranz seiner zweiten Differenz (vgl. _find_loop)
+    ids = {}
+    shape = [ids.setdefault(line[0], len(ids)) if line is not None else -1 for line in parsed] + \
+        [-1] * (2 * max_block + 1)
+    first = [line[2][0] if line is not None and line[2] else 0. for line in parsed] + [0.] * (2 * max_block + 1)
+    tolerance = [2.01 * 10. ** (line[1][0].index('.') + 1 - len(line[1][0])) if line is not None and line[1]
+                 else float('inf') for line in parsed]
+    third = min(min_repeats, 3) - 1
+    out = []
+    macros = {}
+    p = 0
+    while p < len(lines):
+        best = None
+        if parsed[p] is not None:
+            for k in range(1, max_block + 1):
+                q, r = p + k, p + third * k
+                if third and (shape[q] != shape[p] or shape[r] != shape[p]):
+                    continue
+                if third == 2 and abs(first[r] - 2 * first[q] + first[p]) > tolerance[p]:
+                    continue
+                loop = _find_loop(parsed, p, k, min_repeats)
+                if loop is not None and (best is None or loop[0] * k > best[1][0] * best[0]):
+                    best = (k, loop)
+        if best is None:
+            out.append(lines[p])
+            p += 1
+            continue
+        k, (n, starts, steps) = best
+        shapes = tuple(parsed[p + j][0] for j in range(k))
+        if shapes not in macros:
+            macros[shapes] = _macro_name(shapes, prefix)
+        out.append(f"{macros[shapes]:s} N={n:d} " +
+                   ' '.join(f"P{i:d}={start!r} D{i:d}={step!r}" for i, (start, step) in enumerate(zip(starts, steps))))
+        p += n * k
+    config = '\n'.join(_macro(name, shapes) for shapes, name in macros.items())
+    return '\n'.join(out), config
+
+
+def _parse_macros(config: str) -> dict:
+    """
+    Reads macros written by compress(): name -> list of (format string, list of (start index, step index)).
+    """
+    macros = {}
+    name = None
+    for line in config.split('\n'):
+        match = _MACRO.match(line.strip())
+        if match:
+            name = match.group(1).upper()
+            macros[name] = []
+            continue
+        match = _FORMAT.match(line)
+        if match and name is not None:
+            macros[name].append((match.group(1), [(int(a), int(b)) for a, b in _FIELD.findall(match.group(2))]))
+    return macros
+
+
+def _klipper_command(line: str) -> str:
+    """
+    Command name of line as klipper dispatches it (e.g. 'CAM_LOOP_E7DE99E4 N=2' -> 'CAM_LOOP_E7').
+    """
+    parts = _KLIPPER_ARGS.split(line.split(';')[0].strip().upper())
+    if len(parts) >= 3 and parts[1] != 'N':
+        return parts[1] + parts[2].strip()
+    if len(parts) >= 5 and parts[1] == 'N':
+        return parts[3] + parts[4].strip()
+    return ''
+
+
+def expand(script: str, config: str) -> str:
+    """
+    Expands loop macro invocations of compressed script, like klipper does.
+
+    :param script: compressed G-code script
+    :param config: klipper config snippet with macro definitions
+    :return: expanded G-code script
+    """
+    macros = _parse_macros(config)
+    out = []
+    for line in script.split('\n'):
+        command = _klipper_command(line)
+        if command not in macros:
+            out.append(line)
+            continue
+        words = line.split(';')[0].split()
+        params = dict(word.split('=', 1) for word in words[1:])
+        p = {int(key[1:]): float(value) for key, value in params.items() if key[0] == 'P'}
+        d = {int(key[1:]): float(value) for key, value in params.items() if key[0] == 'D'}
+        block = macros[command]
+        for i in range(int(params['N'])):
+            for shape, fields in block:
+                out.append(shape % tuple(p[a] + i * d[b] for a, b in fields))
+    return '\n'.join(out)
+
+
+def check_round_trip(script: str, compressed: str, config: str) -> bool:
+    """
+    Checks that compressed script expands to original script exactly.
+
+    :param script: original G-code script
+    :param compressed: compressed G-code script
+    :param config: klipper config snippet with macro definitions
+    :return: True, raises ValueError with first differing line otherwise
+    """
+    expanded = expand(compressed, config)
+    if expanded == script:
+        return True
+    original, expanded = script.split('\n'), expanded.split('\n')
+    for i, (a, b) in enumerate(zip(original, expanded)):
+        if a != b:
+            raise ValueError(f"Loop compression not equivalent at line {i + 1:d}: {a!r} expanded as {b!r}")
+    raise ValueError(f"Loop compression not equivalent: {len(original):d} lines expanded as {len(expanded):d}")
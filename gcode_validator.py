@@ -0,0 +1,126 @@
+import numpy as np
+
+from toolpath import Toolpath, parse_gcode
+
+"""
+Soft-limit and sanity checks for generated G-code. All checks run as single vectorized sweeps over the
+toolpath arrays, such that whole programs can be checked on every save.
+
+Supported limits (all optional, checks without limit are skipped):
+    x_min, x_max, y_min, y_max, z_min, z_max: float - machine envelope in mm
+    e_max: float - max. extrusion of single move in mm filament
+    allow_negative_e: bool - allow retraction via negative E (default False)
+    min_feedrate, max_feedrate: float - feedrate limits in mm/min
+    max_flow: float - max. volumetric flow in mm³/s (needs filament_diameter)
+    filament_diameter: float - filament diameter in mm
+"""
+
+
+class ValidationReport:
+
+    def __init__(self, toolpath: Toolpath, errors: dict):
+        """
+        Result of validate().
+
+        :param toolpath: validated toolpath
+        :param errors: dict of check name and array of offending move indices
+        """
+        self._toolpath = toolpath
+        self.errors = errors
+
+    def __bool__(self):
+        return self.ok
+
+    @property
+    def ok(self):
+        """
+        True if no check failed.
+        """
+        return not any(len(idx) for idx in self.errors.values())
+
+    def moves(self, check=None):
+        """
+        Returns sorted indices of offending moves.
+
+        :param check: name of check. All checks if None
+        """
+        if check is not None:
+            return self.errors.get(check, np.empty(0, dtype=np.int64))
+        if not self.errors:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(list(self.errors.values())))
+
+    def lines(self, check=None):
+        """
+        Returns line numbers (starting at 1) of offending moves in G-code script.
+
+        :param check: name of check. All checks if None
+        """
+        return self._toolpath.line[self.moves(check)] + 1
+
+    def __str__(self):
+        if self.ok:
+            return f"Validation:\t {len(self._toolpath)} moves ok"
+        text = f"Validation:\t {len(self.moves())} of {len(self._toolpath)} moves violate limits"
+        for check, idx in self.errors.items():
+            if len(idx):
+                lines = ', '.join(str(i) for i in self.lines(check)[:10])
+                more = ', ...' if len(idx) > 10 else ''
+                text += f"\n\t{check}: {len(idx)} moves (lines {lines}{more})"
+        return text
+
+
+def validate(toolpath, **limits) -> ValidationReport:
+    """
+    Checks toolpath against given limits.
+
+    :param toolpath: Toolpath object or G-code script
+    :param limits: see module docstring
+    :return: ValidationReport
+    """
+    if isinstance(toolpath, str):
+        toolpath = parse_gcode(toolpath)
+    errors = {}
+    # Bauraum: Start- und Endpunkt jeder Bewegung prüfen (Bewegungen sind linear). Positionen, die vor der
+    # ersten absoluten Angabe einer Achse nur relativ zu 0 gezählt sind, werden nicht geprüft.
+    for i, axis in enumerate('xyz'):
+        lo = limits.get(f"{axis}_min")
+        hi = limits.get(f"{axis}_max")
+        if lo is None and hi is None:
+            continue
+        coords = np.stack((np.where(toolpath.known_start[:, i], toolpath.start[:, i], np.nan),
+                           np.where(toolpath.known_end[:, i], toolpath.end[:, i], np.nan)), axis=1)
+        bad = np.zeros(len(toolpath), dtype=bool)
+        if lo is not None:
+            bad |= np.any(coords < lo, axis=1)
+        if hi is not None:
+            bad |= np.any(coords > hi, axis=1)
+        errors[f"{axis}_limit"] = np.flatnonzero(bad)
+    e = toolpath.e
+    errors['e_invalid'] = np.flatnonzero(~np.isfinite(e))
+    if not limits.get('allow_negative_e', False):
+        errors['e_negative'] = np.flatnonzero(e < 0)
+    if limits.get('e_max') is not None:
+        errors['e_max'] = np.flatnonzero(np.abs(e) > limits['e_max'])
+    f = toolpath.f
+    if limits.get('min_feedrate') is not None:
+        errors['min_feedrate'] = np.flatnonzero(f < limits['min_feedrate'])
+    if limits.get('max_feedrate') is not None:
+        errors['max_feedrate'] = np.flatnonzero(f > limits['max_feedrate'])
+    if limits.get('max_flow') is not None:
+        errors['max_flow'] = np.flatnonzero(volumetric_flow(toolpath, limits['filament_diameter']) >
+                                            limits['max_flow'])
+    return ValidationReport(toolpath, errors)
+
+
+def volumetric_flow(toolpath: Toolpath, filament_diameter: float):
+    """
+    Volumetric flow of every move in mm³/s. Travel moves and moves without known feedrate have zero flow.
+
+    :param toolpath: Toolpath object
+    :param filament_diameter: filament diameter in mm
+    """
+    volume = np.clip(toolpath.e, 0, None) * np.pi * filament_diameter ** 2 / 4
+    t = toolpath.durations()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(t > 0, volume / t, 0.)
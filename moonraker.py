@@ -2,6 +2,8 @@
 
 import requests
 import json
+import asyncio
+import itertools
 
 '''
 Read the Docs: https://moonraker.readthedocs.io/en/latest/web_api/
@@ -30,15 +32,19 @@ class Moonraker:
     _printer = ''
     _axis = ''
     _feedrate = ''
+    _emergency_stop_on_del = True
 
-    def __init__(self, url='localhost', port=7125):
+    def __init__(self, url='localhost', port=7125, emergency_stop_on_del=True):
         """
         Constructor of moonraker class. Defines URL with moonraker websocket (for HTTP Post/Get requests) and prints
         'state_message' for given printer, if connection is successful.
 
         :param url: URL/IP of printer. Default is localhost
         :param port: Port of moonraker API. Default is 7125
+        :param emergency_stop_on_del: send emergency stop, when object is deleted. Disable for clients which only
+                                      feed jobs (e.g. dispatcher), such that running prints are not stopped
         """
+        self._emergency_stop_on_del = emergency_stop_on_del
         self._set_url(url, port)
         r = get_result(requests.get(f"{self._websocket}/printer/info"))
         # May catch error if connection not successful
@@ -48,7 +54,8 @@ class Moonraker:
         """
         Destructor: Sends M112 - Emergency Stop G-code to printer.
         """
-        requests.post(f"{self._websocket}/printer/emergency_stop")
+        if self._emergency_stop_on_del:
+            requests.post(f"{self._websocket}/printer/emergency_stop")
 
     def _set_url(self, url='localhost', port=7125):
         """
@@ -79,6 +86,355 @@ class Moonraker:
         stae_msg = r['state_message']
         print(f"\tMoonraker:\t {state}:{stae_msg}")
 
-    def upload_code(self):
-        pass
-        # @Todo: https://moonraker.readthedocs.io/en/latest/web_api/#file-upload
+    def query_objects(self, objects: dict):
+        """
+        Queries printer objects (printer/objects/query).
+
+        :param objects: dict of printer objects and list of fields (None for all fields)
+        :return: dict of objects and fields
+        """
+        query = '&'.join(obj if not fields else f"{obj}={','.join(fields)}" for obj, fields in objects.items())
+        return get_result(requests.get(f"{self._websocket}/printer/objects/query?{query}"))['status']
+
+    def get_state(self):
+        """
+        Returns state of klippy (ready, startup, shutdown, error) and of print job (standby, printing, paused,
+        complete, cancelled, error).
+
+        :return: tupel(klippy state, print state)
+        """
+        info = get_result(requests.get(f"{self._websocket}/printer/info"))
+        if info['state'] != 'ready':
+            return info['state'], None
+        return info['state'], self.query_objects({'print_stats': ['state']})['print_stats']['state']
+
+    def upload_code(self, filename: str, script, start_print=False, root='gcodes'):
+        """
+        Uploads G-code file (server/files/upload, multipart/form-data).
+
+        :param filename: filename on printer (relative to root)
+        :param script: G-code script (str or bytes)
+        :param start_print: start print of uploaded file
+        :param root: root folder on printer. Default 'gcodes'
+        :return: dict of upload response (item, print_started, action)
+        """
+        if isinstance(script, str):
+            script = script.encode('utf-8')
+        r = requests.post(f"{self._websocket}/server/files/upload",
+                          files={'file': (filename, script, 'application/octet-stream')},
+                          data={'root': root, 'print': 'true' if start_print else 'false'})
+        response = json.loads(r.text)
+        if 'error' in response:
+            raise Exception(f"Printer reports error: {response['error']}")
+        # Moonraker antwortet beim Upload je nach Version mit oder ohne 'result'
+        return response.get('result', response)
+
+    def start_print(self, filename: str):
+        """
+        Starts print of G-code file on printer (printer/print/start).
+
+        :param filename: filename on printer (relative to gcodes root)
+        """
+        return get_result(requests.post(f"{self._websocket}/printer/print/start", params={'filename': filename}))
+
+    def subscribe(self, objects=None):
+        """
+        Returns websocket subscription client for same printer. Has to be connected via 'await connect()' or
+        'async with'.
+
+        :param objects: Printer objects and fields to subscribe to. Default is SUBSCRIBE_OBJECTS
+        :return: MoonrakerSubscription object
+        """
+        return MoonrakerSubscription(self._websocket, objects=objects)
+
+
+# Objekte und Felder, die standardmäßig abonniert werden
+SUBSCRIBE_OBJECTS = {
+    'toolhead': ['position', 'homed_axes', 'print_time', 'estimated_print_time'],
+    'motion_report': ['live_position', 'live_velocity'],
+    'idle_timeout': ['state'],
+    'print_stats': None,
+}
+
+
+def websocket_url(url='localhost', port=None):
+    """
+    Builds websocket URL of moonraker API (ws://<host>:<port>/websocket) from HTTP URL.
+
+    :param url: URL/IP of printer, with or without http(s):// prefix and port
+    :param port: Port of moonraker API. Only appended if given
+    :return: websocket URL
+    """
+    if url.startswith('https://'):
+        url = 'wss://' + url[len('https://'):]
+    elif url.startswith('http://'):
+        url = 'ws://' + url[len('http://'):]
+    elif not url.startswith(('ws://', 'wss://')):
+        url = 'ws://' + url
+    url = url.rstrip('/')
+    if port is not None:
+        url = f"{url}:{port}"
+    return f"{url}/websocket"
+
+
+class MoonrakerSubscription:
+    """
+    Websocket client for moonraker API. Subscribes to printer objects (printer.objects.subscribe) and keeps
+    local copy of printer status, which is updated with every notify_status_update.
+    Provides awaitable primitives (motion complete, position reached), which resolve as soon as status update
+    arrives instead of polling or sleeping.
+
+    Needs aiohttp (pip install aiohttp).
+    """
+
+    def __init__(self, url='localhost', port=None, objects=None):
+        """
+        Constructor of subscription client. Connection is opened with connect().
+
+        :param url: URL/IP of printer. Accepts http(s):// and ws(s):// URLs
+        :param port: Port of moonraker API. Only necessary if not part of url
+        :param objects: dict of printer objects and list of fields (None for all fields). Default SUBSCRIBE_OBJECTS
+        """
+        self._url = websocket_url(url, port)
+        self._objects = objects if objects is not None else SUBSCRIBE_OBJECTS
+        self._status = {}
+        self._eventtime = 0.
+        self._session = None
+        self._ws = None
+        self._reader = None
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._waiters = []
+        self._updates = 0
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def connect(self):
+        """
+        Opens websocket, starts receiving and subscribes to printer objects.
+
+        :return: initial status of subscribed objects
+        """
+        import aiohttp
+        self._session = aiohttp.ClientSession()
+        self._ws = await self._session.ws_connect(self._url)
+        self._reader = asyncio.get_running_loop().create_task(self._receive())
+        result = await self.call('printer.objects.subscribe', objects=self._objects)
+        self._update_status(result['status'], result.get('eventtime', 0.))
+        print(f"\tMoonraker:\t Subscribed to {', '.join(self._objects)}")
+        return self._status
+
+    async def close(self):
+        """
+        Closes websocket. Pending calls and waiters are cancelled.
+        """
+        if self._reader is not None:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
+            self._reader = None
+        if self._ws is not None:
+            await self._ws.close()
+            self._ws = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        self._cancel_all(ConnectionError("Moonraker websocket closed"))
+
+    async def call(self, method: str, **params):
+        """
+        JSON-RPC call via websocket.
+
+        :param method: moonraker method, e.g. printer.gcode.script
+        :param params: parameters of method
+        :return: result of call
+        """
+        if self._ws is None:
+            raise ConnectionError("Moonraker websocket not connected")
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        await self._ws.send_json({'jsonrpc': '2.0', 'method': method, 'params': params, 'id': request_id})
+        return await future
+
+    async def send_g_code(self, gcode: str):
+        """
+        Sends given G-code via websocket. Returns as soon as klipper accepted the command, not when the
+        move is finished. Use wait_motion_complete() for that.
+
+        :param gcode: G-code to be sent
+        """
+        return await self.call('printer.gcode.script', script=gcode)
+
+    async def query_status(self):
+        """
+        Requests current status of subscribed objects (printer.objects.query) and merges it into local status,
+        independent of status notifications.
+
+        :return: status dict
+        """
+        result = await self.call('printer.objects.query', objects=self._objects)
+        self._update_status(result['status'], result.get('eventtime', self._eventtime))
+        return self._status
+
+    async def _receive(self):
+        """
+        Receives messages from websocket. Resolves call results and processes status notifications.
+        """
+        import aiohttp
+        try:
+            async for msg in self._ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                data = json.loads(msg.data)
+                if 'id' in data and data['id'] in self._pending:
+                    future = self._pending.pop(data['id'])
+                    if future.done():
+                        continue
+                    if 'error' in data:
+                        future.set_exception(Exception(f"Printer reports error: {data['error']}"))
+                    else:
+                        future.set_result(data.get('result'))
+                elif data.get('method') == 'notify_status_update':
+                    status, eventtime = data['params']
+                    self._update_status(status, eventtime)
+        finally:
+            self._cancel_all(ConnectionError("Moonraker websocket closed"))
+
+    def _cancel_all(self, exc: Exception):
+        """
+        Fails all pending calls and waiters with given exception.
+        """
+        for future in list(self._pending.values()) + [f for _, f in self._waiters]:
+            if not future.done():
+                future.set_exception(exc)
+        self._pending.clear()
+        self._waiters.clear()
+
+    def _update_status(self, status: dict, eventtime: float):
+        """
+        Merges (partial) status update into local status and checks waiting predicates.
+
+        :param status: dict of changed objects/fields
+        :param eventtime: klipper eventtime of update
+        """
+        for obj, fields in status.items():
+            self._status.setdefault(obj, {}).update(fields)
+        self._eventtime = eventtime
+        self._updates += 1
+        waiters = []
+        for predicate, future in self._waiters:
+            if future.done():
+                continue
+            try:
+                if predicate(self._status):
+                    future.set_result(self._status)
+                    continue
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            waiters.append((predicate, future))
+        self._waiters = waiters
+
+    # Getter #
+    def get_status(self, obj=None):
+        """
+        Returns local copy of printer status.
+
+        :param obj: name of printer object. Returns all objects if None
+        """
+        return self._status if obj is None else self._status.get(obj, {})
+
+    def get_pos(self):
+        """
+        Returns live position (X,Y,Z) of toolhead. Falls back to commanded position, if motion_report
+        is not subscribed.
+
+        :return tupel(X,Y,Z)
+        """
+        pos = self._status.get('motion_report', {}).get('live_position') or \
+            self._status.get('toolhead', {}).get('position') or [0., 0., 0.]
+        return tuple(pos[:3])
+
+    # Awaitables #
+    async def wait_for(self, predicate, timeout=None, fresh=True):
+        """
+        Waits until predicate(status) is true.
+
+        :param predicate: callable taking status dict, returns bool
+        :param timeout: timeout in s. None waits forever
+        :param fresh: if True, only status updates after this call are considered
+        :return: status dict
+        """
+        if not fresh and predicate(self._status):
+            return self._status
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((predicate, future))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            if not future.done():
+                future.cancel()
+
+    def _motion_done(self, status: dict, tolerance: float) -> bool:
+        """
+        Motion is complete if klipper is not busy anymore and live position equals commanded position.
+        """
+        if status.get('idle_timeout', {}).get('state') == 'Printing':
+            return False
+        live = status.get('motion_report', {}).get('live_position')
+        target = status.get('toolhead', {}).get('position')
+        if live is None or target is None:
+            return True
+        return all(abs(a - b) <= tolerance for a, b in zip(live[:3], target[:3]))
+
+    async def wait_motion_complete(self, timeout=None, tolerance=1e-3):
+        """
+        Waits until all queued moves are executed. Sends M400 (klipper answers after all moves are executed)
+        and queries the status afterwards, such that status from before sending the last G-code can't complete
+        the wait and no status update is needed, if nothing changes (e.g. move to current position).
+
+        :param timeout: timeout in s. None waits forever
+        :param tolerance: allowed difference between live and commanded position in mm
+        """
+        async def wait():
+            await self.send_g_code("M400")
+            await self.query_status()
+            return await self.wait_for(lambda s: self._motion_done(s, tolerance), fresh=False)
+
+        return await asyncio.wait_for(wait(), timeout)
+
+    async def wait_position_reached(self, x=None, y=None, z=None, tolerance=1e-2, timeout=None, fresh=False):
+        """
+        Waits until live position of toolhead reaches given coordinates. Axes which are not given are ignored.
+
+        :param x,y,z: Position in mm
+        :param tolerance: allowed difference in mm
+        :param timeout: timeout in s. None waits forever
+        :param fresh: if True, current local status is not checked
+        """
+        target = [(i, v) for i, v in enumerate((x, y, z)) if v is not None]
+
+        def reached(status):
+            pos = status.get('motion_report', {}).get('live_position') or \
+                status.get('toolhead', {}).get('position')
+            return pos is not None and all(abs(pos[i] - v) <= tolerance for i, v in target)
+
+        return await self.wait_for(reached, timeout, fresh)
+
+    async def move(self, gcode: str, timeout=None):
+        """
+        Sends G-code and waits until resulting motion is complete.
+
+        :param gcode: G-code to be sent
+        :param timeout: timeout in s. None waits forever
+        """
+        await self.send_g_code(gcode)
+        return await self.wait_motion_complete(timeout)
@@ -0,0 +1,199 @@
+import numpy as np
+
+from toolpath import Toolpath, parse_gcode
+
+"""
+Level-of-detail previews of toolpaths for viewers and clipboard. Printing moves are joined to polylines and
+simplified with Douglas-Peucker. The simplification is computed once for all tolerances: every point gets the
+tolerance up to which it is kept (importance), so previews for any tolerance or move budget are a simple
+threshold. Additionally segments are grouped into per-layer tiles.
+The full resolution script is not changed.
+"""
+
+
+def _ranges(a, b):
+    """
+    Concatenated index ranges a[i]+1 ... b[i]-1 (interior points of intervals) and interval id per index.
+    """
+    n = b - a - 1
+    seg = np.repeat(np.arange(len(a)), n)
+    offset = np.arange(len(seg)) - np.repeat(np.cumsum(n) - n, n)
+    return a[seg] + 1 + offset, seg, n
+
+
+def _point_segment_distance(p, a, b):
+    """
+    Distance of points p to segments a-b (all (n,3) arrays).
+    """
+    ab = b - a
+    denom = np.einsum('ij,ij->i', ab, ab)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.clip(np.einsum('ij,ij->i', p - a, ab) / denom, 0., 1.)
+    t = np.where(denom > 0, t, 0.)
+    return np.linalg.norm(p - (a + t[:, None] * ab), axis=1)
+
+
+def douglas_peucker_importance(points, starts, ends):
+    """
+    Vectorized Douglas-Peucker for many polylines at once. All open intervals of all polylines are split in one
+    NumPy sweep per recursion level.
+
+    :param points: (n,3) array of all polyline points
+    :param starts: index of first point of every polyline
+    :param ends: index of last point of every polyline
+    :return: (n,) array - max. tolerance up to which point is kept (inf for polyline ends). Points with
+             importance > tolerance form the Douglas-Peucker simplification for this tolerance.
+    """
+    importance = np.zeros(len(points))
+    importance[starts] = np.inf
+    importance[ends] = np.inf
+    a, b = np.asarray(starts), np.asarray(ends)
+    parent = np.full(len(a), np.inf)
+    while len(a):
+        sel = b - a > 1
+        a, b, parent = a[sel], b[sel], parent[sel]
+        if not len(a):
+            break
+        idx, seg, n = _ranges(a, b)
+        d = _point_segment_distance(points[idx], points[a[seg]], points[b[seg]])
+        # Punkt mit größtem Abstand je Intervall (bei Gleichstand der erste)
+        order = np.lexsort((-idx, d, seg))
+        best = order[np.cumsum(n) - 1]
+        split, dmax = idx[best], d[best]
+        # Kind nie wichtiger als Elternpunkt -> Schwellwert ergibt exakt DP-Ergebnis der Toleranz
+        importance[split] = np.minimum(dmax, parent)
+        go = dmax > 0
+        split, a, b = split[go], a[go], b[go]
+        a, b = np.concatenate((a, split)), np.concatenate((split, b))
+        parent = np.concatenate((importance[split], importance[split]))
+    return importance
+
+
+class Preview:
+
+    def __init__(self, toolpath, layer_precision=1e-3):
+        """
+        Builds multi-resolution representation of printing moves of toolpath.
+
+        :param toolpath: Toolpath object or G-code script
+        :param layer_precision: Z values closer than this are in the same layer (mm)
+        """
+        if isinstance(toolpath, str):
+            toolpath = parse_gcode(toolpath)
+        self._toolpath = toolpath
+        ext = np.flatnonzero(toolpath.is_extrusion())
+        start, end = toolpath.start[ext], toolpath.end[ext]
+        new = np.ones(len(ext), dtype=bool)
+        new[1:] = (ext[1:] != ext[:-1] + 1) | np.any(start[1:] != end[:-1], axis=1)
+        poly = np.cumsum(new) - 1
+        first = np.flatnonzero(new)
+        n_poly = len(first)
+        # Punkte: Startpunkt je Polylinie, danach Endpunkte der Bewegungen
+        self.points = np.empty((len(ext) + n_poly, 3))
+        point_of_move = np.arange(len(ext)) + poly + 1
+        self.starts = first + np.arange(n_poly)
+        self.ends = np.concatenate((self.starts[1:] - 1, [len(self.points) - 1])) if n_poly else self.starts
+        self.points[point_of_move] = end
+        self.points[self.starts] = start[first]
+        # Kumulierte Extrusion und Vorschub je Punkt, für Extrusion der vereinfachten Segmente
+        e_cum = np.cumsum(toolpath.e[ext])
+        self._e_cum = np.empty(len(self.points))
+        self._e_cum[point_of_move] = e_cum
+        self._e_cum[self.starts] = (e_cum - toolpath.e[ext])[first]
+        self._f = np.zeros(len(self.points))
+        self._f[point_of_move] = toolpath.f[ext]
+        self._polyline = np.repeat(np.arange(n_poly), np.diff(np.concatenate((self.starts, [len(self.points)]))))
+        self.importance = douglas_peucker_importance(self.points, self.starts, self.ends)
+        z = np.round(self.points[:, 2] / layer_precision) * layer_precision
+        self.layers, self._layer = np.unique(z, return_inverse=True)
+
+    def __len__(self):
+        """
+        Number of printing moves at full resolution.
+        """
+        return len(self.points) - len(self.starts)
+
+    def tolerance_for(self, max_moves: int) -> float:
+        """
+        Smallest tolerance, such that preview has at most max_moves printing moves. Points with importance equal to
+        the tolerance are dropped, so the budget also holds for collinear points (importance 0).
+
+        :param max_moves: budget of printing moves
+        :return: tolerance in mm
+        """
+        inner = np.sort(self.importance[np.isfinite(self.importance)])[::-1]
+        # Jede Polylinie braucht mindestens ein Segment
+        budget = max_moves - len(self.starts)
+        if budget < 0:
+            raise ValueError(f"At least {len(self.starts):d} moves necessary (one per polyline)")
+        if budget >= len(inner):
+            return 0.
+        return float(inner[budget])
+
+    def segments(self, tolerance=None):
+        """
+        Segments of simplified polylines.
+
+        :param tolerance: Douglas-Peucker tolerance in mm, points with importance > tolerance are kept.
+                          None keeps all points (full resolution)
+        :return: tupel(start point indices, end point indices)
+        """
+        kept = np.flatnonzero(self.importance > tolerance) if tolerance is not None else \
+            np.arange(len(self.points))
+        same = self._polyline[kept[1:]] == self._polyline[kept[:-1]]
+        return kept[:-1][same], kept[1:][same]
+
+    def tiles(self, tolerance=None, size=10.):
+        """
+        Groups simplified segments by layer and square XY tile (by segment midpoint).
+
+        :param tolerance: Douglas-Peucker tolerance in mm. None keeps all points
+        :param size: edge length of tiles in mm
+        :return: dict of (layer index, tile x, tile y) and array of segment indices (see segments())
+        """
+        a, b = self.segments(tolerance)
+        mid = (self.points[a] + self.points[b]) / 2
+        keys = np.column_stack((self._layer[b], np.floor(mid[:, :2] / size).astype(np.int64)))
+        unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+        order = np.argsort(inverse.ravel(), kind='stable')
+        groups = np.split(order, np.cumsum(np.bincount(inverse.ravel(), minlength=len(unique)))[:-1])
+        return {tuple(int(v) for v in key): group for key, group in zip(unique, groups)}
+
+    def to_gcode(self, tolerance=None, max_moves=None, layers=None, tile=None, tile_size=10.):
+        """
+        G-code of simplified toolpath. Travel moves are replaced by one G0 to start of next segment chain.
+
+        :param tolerance: Douglas-Peucker tolerance in mm
+        :param max_moves: budget of printing moves, used if tolerance is None. Full resolution if both are None
+        :param layers: iterable of layer indices to export. All layers if None
+        :param tile: (layer index, tile x, tile y) to export only one tile
+        :param tile_size: edge length of tiles in mm
+        :return: G-code script
+        """
+        if tolerance is None:
+            tolerance = self.tolerance_for(max_moves) if max_moves is not None else None
+        a, b = self.segments(tolerance)
+        if tile is not None:
+            sel = self.tiles(tolerance, tile_size).get(tuple(tile), np.empty(0, dtype=np.int64))
+            a, b = a[sel], b[sel]
+        if layers is not None:
+            sel = np.isin(self._layer[b], list(layers))
+            a, b = a[sel], b[sel]
+        e = self._e_cum[b] - self._e_cum[a]
+        f = self._f[b]
+        lines = [f"; preview: {len(a):d} of {len(self):d} printing moves, tolerance "
+                 f"{'-' if tolerance is None else f'{tolerance:.4f} mm'}",
+                 "G90", "M83"]
+        last_b, last_f = -1, None
+        for i in range(len(a)):
+            if a[i] != last_b:
+                x, y, z = self.points[a[i]]
+                lines.append(f"G0X{x:.3f}Y{y:.3f}Z{z:.3f}")
+            x, y, z = self.points[b[i]]
+            code = f"G1X{x:.3f}Y{y:.3f}Z{z:.3f}E{e[i]:.6f}"
+            if f[i] != last_f and f[i] > 0:
+                code += f"F{f[i]:.3f}"
+                last_f = f[i]
+            lines.append(code)
+            last_b = b[i]
+        return '\n'.join(lines) + '\n'
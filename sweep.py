@@ -0,0 +1,164 @@
+#!/usr/bin/python3.8
+import argparse
+import hashlib
+import inspect
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import cli
+from CAM_methods import CAM_structures
+
+'''
+Parallel parameter sweep. Generates one G-code file per combination of a parameter grid in a process pool and
+writes a manifest (parameters, file hash, size, estimated print time).
+
+    python sweep.py job.json -d sweep_out [-j 8] [-e gzip]
+
+job.json is a parameter file of cli.py with additional key "sweep":
+    "sweep": {"layer_width": [0.4, 0.45], "layer_height": [0.1, 0.2], "overlap": [0.2, 0.25], "backlash": [0]}
+
+Grid keys which are parameters of a CAM_structures method (e.g. overlap) are applied to all jobs using that
+method, all other keys are print properties. Combinations resulting in identical configurations are generated
+only once.
+'''
+
+
+def _job_parameters():
+    """
+    Returns dict of CAM_structures method names and their parameter names.
+    """
+    return {name: set(inspect.signature(method).parameters)
+            for name, method in inspect.getmembers(CAM_structures, inspect.isfunction) if not name.startswith('_')}
+
+
+def expand_grid(params: dict, grid: dict):
+    """
+    Creates parameter sets for all combinations of grid values.
+
+    :param params: base parameter dict, see cli
+    :param grid: dict of parameter name and list of values
+    :return: list of tupel(grid values, parameter dict)
+    """
+    job_parameters = _job_parameters()
+    keys = list(grid)
+    variants = []
+    for values in itertools.product(*(grid[key] for key in keys)):
+        variant = json.loads(json.dumps(params))
+        variant.pop('sweep', None)
+        variant.setdefault('properties', {})
+        for key, value in zip(keys, values):
+            jobs = [job for job in variant.get('jobs', []) if key in job_parameters.get(job['method'], ())]
+            if jobs:
+                for job in jobs:
+                    job[key] = value
+            else:
+                variant['properties'][key] = value
+        variants.append((dict(zip(keys, values)), variant))
+    return variants
+
+
+def _normalize(value):
+    """
+    Converts numbers to float (recursively), such that equal numbers (0 and 0.0) result in equal JSON.
+    """
+    if isinstance(value, dict):
+        return {key: _normalize(v) for key, v in value.items()}
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+
+def config_hash(params: dict) -> str:
+    """
+    Hash of resolved configuration. Identical configurations have identical hashes.
+
+    :param params: parameter dict
+    """
+    config = {key: value for key, value in params.items() if key not in ('output', 'sweep')}
+    return hashlib.sha256(json.dumps(_normalize(config), sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _generate(task):
+    """
+    Worker: generates and saves one variant, returns manifest entry.
+    """
+    params, filename, encoding = task
+    interface = cli.build_job(params)
+    interface.save_script(filename, encoding)
+    import toolpath
+    print_time = toolpath.parse_gcode(interface.get_script()).estimate_print_time()
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return {'file': os.path.basename(filename), 'sha256': sha.hexdigest(), 'size': os.path.getsize(filename),
+            'estimated_print_time': print_time}
+
+
+def run_sweep(params: dict, grid: dict, directory: str, encoding='plain', workers=None, name=None):
+    """
+    Generates all variants of grid in parallel and writes manifest.json into directory.
+
+    :param params: base parameter dict, see cli
+    :param grid: dict of parameter name and list of values
+    :param directory: output directory
+    :param encoding: encoding of generated files, see gcode_encoding
+    :param workers: number of processes. Default is number of CPUs
+    :param name: base name of files. Default is base name of 'output' of params
+    :return: manifest dict
+    """
+    import gcode_encoding
+    os.makedirs(directory, exist_ok=True)
+    name = name or os.path.basename(params.get('output', 'sweep.gcode')).split('.')[0]
+    extension = gcode_encoding.EXTENSIONS[encoding]
+    variants = {}
+    duplicates = 0
+    for values, variant in expand_grid(params, grid):
+        key = config_hash(variant)
+        if key in variants:
+            variants[key]['parameters'].append(values)
+            duplicates += 1
+        else:
+            variants[key] = {'parameters': [values], 'params': variant}
+    tasks = [(v['params'], os.path.join(directory, f"{name}_{key[:12]}{extension}"), encoding)
+             for key, v in variants.items()]
+    print(f"Sweep:\t {len(tasks):d} variants ({duplicates:d} duplicate configurations skipped)")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_generate, tasks))
+    entries = []
+    for (key, v), result in zip(variants.items(), results):
+        entry = {'config_hash': key, 'parameters': v['parameters'][0]}
+        if len(v['parameters']) > 1:
+            entry['duplicates'] = v['parameters'][1:]
+        entry.update(result)
+        entries.append(entry)
+    manifest = {'grid': grid, 'encoding': encoding, 'base': {k: v for k, v in params.items() if k != 'sweep'},
+                'variants': entries}
+    with open(os.path.join(directory, 'manifest.json'), mode='w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Manifest saved at {os.path.join(directory, 'manifest.json')}")
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate G-code variants of a parameter grid in parallel.")
+    parser.add_argument('params', help="parameter file (JSON) with key 'sweep'")
+    parser.add_argument('-d', '--directory', default='sweep', help="output directory")
+    parser.add_argument('-j', '--jobs', type=int, help="number of processes (default: number of CPUs)")
+    parser.add_argument('-e', '--encoding', default='plain', choices=('plain', 'gzip', 'meatpack', 'bgcode'),
+                        help="encoding of output files")
+    args = parser.parse_args(argv)
+    params = cli.load_parameters(args.params)
+    if not params.get('sweep'):
+        parser.error("parameter file has no 'sweep' grid")
+    run_sweep(params, params['sweep'], args.directory, args.encoding, args.jobs)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
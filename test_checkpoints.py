@@ -0,0 +1,37 @@
+from CAM_Interface import CAM_Interface
+from CAM_methods import CAM_structures
+
+'''
+Tests of checkpoints of CAM_Interface.
+
+    python -m pytest test_checkpoints.py
+'''
+
+
+def _interface():
+    return CAM_Interface(start_tool=0, backlash=0.05, t0_temp=200, bed_temp=60, simulation=True,
+                         nozzle_diameter=.4, filament_diameter=1.75, layer_width=.45, layer_height=.2,
+                         auto_checkpoint=True)
+
+
+def test_unique_names():
+    interface = _interface()
+    structures = CAM_structures(interface)
+    interface.abs_move(x=10, y=10, z=.2, f=1200)
+    structures.square_aperture(10, 2)
+    interface.abs_move(x=40, y=10)
+    structures.square_aperture(10, 2)
+    # Gleiche Höhe zweimal angefahren
+    interface.abs_move(z=1)
+    interface.abs_move(z=.2)
+    names = [c['name'] for c in interface.get_checkpoints()]
+    assert names == ['z=0.200', 'square_aperture', 'square_aperture#2', 'z=1.000', 'z=0.200#2']
+    offset = interface.get_checkpoints()[2]['offset']
+    interface.restore('square_aperture#2')
+    assert len(interface.get_script()) == offset
+    assert [c['name'] for c in interface.get_checkpoints()] == names[:2]
+
+
+if __name__ == '__main__':
+    test_unique_names()
+    print("ok")
@@ -0,0 +1,23 @@
+import numpy as np
+
+import feedrate_planner
+from toolpath import parse_gcode
+
+'''
+Tests of volumetric flow aware feedrate planning.
+
+    python -m pytest test_feedrate_planner.py
+'''
+
+
+def test_extrude_factor():
+    # M221 S200 verdoppelt die Extrusion, der Vorschub für gleichen Fluss halbiert sich
+    toolpath = parse_gcode("G90\nM83\nG1X0\nG1X10E1F6000\nM221 S200\nG1X20E1\nM221S100\nG1X30E1\n")
+    assert np.allclose(toolpath.e, [0., 1., 2., 1.])
+    f = feedrate_planner.plan(toolpath, 1.75, max_flow=10., max_feedrate=12000.)
+    assert np.isclose(f[1], 2 * f[2]) and np.isclose(f[1], f[3])
+
+
+if __name__ == '__main__':
+    test_extrude_factor()
+    print("ok")
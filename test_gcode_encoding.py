@@ -0,0 +1,36 @@
+import io
+
+import gcode_encoding
+
+'''
+Tests of G-code encodings.
+
+    python -m pytest test_gcode_encoding.py
+'''
+
+_SCRIPT = "G90\nG1 X10.000 Y10.000 F1200 ; Start\nG1X20.000E0.500\n" * 50
+
+
+def test_write():
+    # Rückgabewert von write() ist die Dateigröße, gzip Header eingeschlossen
+    for encoding in gcode_encoding.ENCODINGS:
+        f = io.BytesIO(b'xx')
+        f.seek(2)
+        n = gcode_encoding.write(_SCRIPT, f, encoding, chunk_size=64)
+        assert n == len(f.getvalue()) - 2
+        assert gcode_encoding.decode(f.getvalue()[2:], encoding) == \
+            (gcode_encoding.minify(_SCRIPT) if encoding == 'meatpack' else _SCRIPT)
+
+
+def test_minify_messages():
+    # Meldungstext von M117/M118 behält seine Leerzeichen, klassische Befehle nicht
+    script = "M117 Layer 2 of 10 ; Kommentar\nG1 X1 Y2\nm118 E1 done\nM1170 A B\n"
+    assert gcode_encoding.minify(script) == "M117 Layer 2 of 10\nG1X1Y2\nm118 E1 done\nM1170AB\n"
+    assert gcode_encoding.decode(gcode_encoding.encode(script, 'meatpack'), 'meatpack') == \
+        gcode_encoding.minify(script)
+
+
+if __name__ == '__main__':
+    test_write()
+    test_minify_messages()
+    print("ok")
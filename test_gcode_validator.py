@@ -0,0 +1,30 @@
+from gcode_validator import validate
+from toolpath import parse_gcode
+
+'''
+Tests of G-code parser and soft-limit checks.
+
+    python -m pytest test_gcode_validator.py
+'''
+
+
+def test_unknown_start():
+    # Startposition vor der ersten absoluten Bewegung ist unbekannt, keine Verletzung durch angenommenes (0,0,0)
+    script = "G90\nG1X10Y10Z0.2F1200\nG1X20E0.5\n"
+    toolpath = parse_gcode(script)
+    assert not toolpath.known_start[0].any() and toolpath.known_start[1].all()
+    assert validate(script, x_min=5, y_min=5).ok
+    report = validate("G90\nG1X10Y10Z0.2F1200\nG1X2E0.5\n", x_min=5, y_min=5)
+    assert list(report.lines('x_limit')) == [3] and not len(report.lines('y_limit'))
+
+
+def test_relative_before_absolute():
+    # Relative Bewegungen vor der ersten absoluten Angabe werden nicht geprüft, danach schon
+    report = validate("G91\nG1X2F1200\nG90\nG1X20E0.5\nG91\nG1X-30\n", x_min=5)
+    assert list(report.lines('x_limit')) == [6]
+
+
+if __name__ == '__main__':
+    test_unknown_start()
+    test_relative_before_absolute()
+    print("ok")
@@ -0,0 +1,145 @@
+import asyncio
+
+from dispatcher import Dispatcher
+from fake_moonraker import FakeMoonraker
+from moonraker import MoonrakerSubscription
+
+'''
+Tests of moonraker clients against local fake_moonraker servers (no printer needed).
+
+    python -m pytest test_moonraker.py
+    python test_moonraker.py
+'''
+
+
+async def _subscription():
+    server = await FakeMoonraker().start()
+    try:
+        async with MoonrakerSubscription(server.url, server.port) as sub:
+            # Bewegung 10 mm mit 100 mm/s
+            await sub.move("G1 X10 F6000", timeout=5)
+            assert abs(sub.get_pos()[0] - 10) < 1e-6
+            assert sub.get_status('idle_timeout')['state'] == 'Ready'
+
+            await sub.send_g_code("G1 X20 Y5 F6000")
+            await sub.wait_position_reached(x=20, y=5, timeout=5)
+            assert abs(sub.get_pos()[0] - 20) < 1e-2
+
+            # Relative Bewegung, Bewegungsende ohne Polling
+            await sub.send_g_code("G91\nG1 X-5 F6000\nG90")
+            await sub.wait_motion_complete(timeout=5)
+            assert abs(sub.get_pos()[0] - 15) < 1e-6
+
+            try:
+                await sub.wait_position_reached(x=100, timeout=.2)
+                raise AssertionError("position was never commanded")
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        await server.stop()
+    assert "G1 X10 F6000" in server.gcode_log
+
+
+def test_subscription():
+    asyncio.run(_subscription())
+
+
+async def _move_without_update():
+    server = await FakeMoonraker().start()
+    objects = {'toolhead': ['position'], 'motion_report': ['live_position'], 'idle_timeout': ['state']}
+    try:
+        async with MoonrakerSubscription(server.url, server.port, objects=objects) as sub:
+            await sub.move("G1 X10 F6000", timeout=5)
+            # Bewegung auf aktuelle Position: keine Statusänderung, trotzdem kein Hängenbleiben
+            await sub.move("G1 X10 F6000", timeout=1)
+            await sub.wait_motion_complete(timeout=1)
+            assert abs(sub.get_pos()[0] - 10) < 1e-6
+    finally:
+        await server.stop()
+
+
+def test_move_without_update():
+    asyncio.run(_move_without_update())
+
+
+class _BusyOnce(FakeMoonraker):
+    """
+    Fake printer, which refuses the first print start (printer became busy after state request).
+    """
+    refuse = 1
+
+    def start_print(self, filename: str):
+        if self.refuse:
+            self.refuse -= 1
+            raise Exception("Printer is busy")
+        super().start_print(filename)
+
+
+def _script(n: int) -> str:
+    return "G90\nG1 X0 Y0 F6000\n" + "".join(f"G1 X{10 * (i % 2):d} Y{i:d}\n" for i in range(n))
+
+
+def test_dispatcher():
+    servers = [FakeMoonraker(time_scale=.01).run_in_thread() for _ in range(3)]
+    try:
+        dispatcher = Dispatcher({f"p{i:d}": (s.url, s.port) for i, s in enumerate(servers)}, poll_interval=.02)
+        jobs = [dispatcher.submit(_script(10 + i), f"job{i:d}.gcode", priority=i % 3) for i in range(9)]
+        with dispatcher:
+            dispatcher.join()
+        assert all(job.done.is_set() and job.error is None for job in jobs)
+        # Jeder Drucker hat Jobs bekommen, jeder Job liegt auf genau dem zugewiesenen Drucker
+        for i, server in enumerate(servers):
+            assert sorted(server.files) == sorted(job.filename for job in jobs if job.printer == f"p{i:d}")
+            assert server.files
+        # Höchste Priorität (0) zuerst zugewiesen
+        first = sorted(jobs, key=lambda job: job.assigned)[:3]
+        assert all(job.priority == 0 for job in first)
+        metrics = dispatcher.metrics()
+        assert sum(m['jobs'] for m in metrics.values()) == 9
+        assert all(m['throughput'] > 0 and m['max_latency'] >= m['mean_latency'] for m in metrics.values())
+    finally:
+        for server in servers:
+            server.stop_thread()
+
+
+def test_dispatcher_retry():
+    server = _BusyOnce(time_scale=0).run_in_thread()
+    try:
+        dispatcher = Dispatcher({'p': (server.url, server.port)}, poll_interval=.02)
+        job = dispatcher.submit(_script(3), "retry.gcode")
+        with dispatcher:
+            assert dispatcher.join(timeout=5)
+        assert job.error is None and job.attempts == 2
+        assert dispatcher.metrics()['p']['retried'] == 1
+        assert server.status['print_stats']['filename'] == "retry.gcode"
+    finally:
+        server.stop_thread()
+
+
+def test_dispatcher_join_timeout():
+    server = FakeMoonraker(time_scale=0).run_in_thread()
+    try:
+        dispatcher = Dispatcher({'p': (server.url, server.port)}, poll_interval=.02)
+        # Drucker druckt noch, der Job bleibt in der Warteschlange
+        server.status['print_stats']['state'] = 'printing'
+        job = dispatcher.submit(_script(3), "late.gcode")
+        assert not dispatcher.join(timeout=.1)
+        with dispatcher:
+            assert not dispatcher.join(timeout=.1)
+            server.status['print_stats']['state'] = 'complete'
+            assert dispatcher.join(timeout=5)
+        assert job.done.is_set() and job.error is None
+        # Nach shutdown() blockiert join() nicht für Jobs, die niemand mehr bearbeitet
+        dispatcher.submit(_script(3), "never.gcode")
+        assert not dispatcher.join()
+    finally:
+        server.stop_thread()
+
+
+if __name__ == '__main__':
+    test_subscription()
+    test_move_without_update()
+    test_dispatcher()
+    test_dispatcher_retry()
+    test_dispatcher_join_timeout()
+    print("ok")
@@ -0,0 +1,28 @@
+from CAM_Interface import CAM_Interface
+
+'''
+Tests of travel policy (z-lift, retraction, combing) in CAM_Interface.
+
+    python -m pytest test_travel_planner.py
+'''
+
+
+def test_combing_feedrate():
+    # Ohne Simulation, sonst werden weder z-lift noch Rückzug angefordert
+    interface = CAM_Interface(start_tool=0, backlash=0, t0_temp=200, bed_temp=60,
+                              nozzle_diameter=.4, filament_diameter=1.75, layer_width=.45, layer_height=.2,
+                              travel_policy={'min_distance': 1, 'combing': True, 'max_comb_ratio': 3})
+    interface.abs_move(x=0, y=0, z=.2)
+    interface.abs_print(x=10, f=600)
+    interface.abs_print(y=10)
+    # Fahrt über das gedruckte L: Umweg über (10, 0) mit Vorschub der Fahrt ab dem ersten Wegpunkt
+    interface.abs_move(x=0, y=0, z_lift=1, retract=True, f=6000)
+    lines = interface.get_script().rstrip('\n').split('\n')
+    assert lines[-2].startswith("G1X10.") and lines[-2].endswith("F6000.000")
+    assert lines[-1] == "G1X0.000Y0.000"
+    assert interface.get_travel_statistics()['combed'] == 1
+
+
+if __name__ == '__main__':
+    test_combing_feedrate()
+    print("ok")
@@ -0,0 +1,223 @@
+import numpy as np
+
+"""
+Toolpath representation of G-code scripts as NumPy arrays. One entry per move (G0/G1), with absolute
+start/end coordinates, relative extrusion and effective feedrate, such that checks and planning passes can
+work on whole programs in single vectorized sweeps instead of line by line.
+"""
+
+# Lookup-Tabellen für Bytes: Großbuchstaben (CR -> Leerzeichen) und Zeichenklasse (1 Buchstabe, 2 Zahl)
+_UPPER = np.arange(256, dtype=np.uint8)
+_UPPER[ord('a'):ord('z') + 1] -= 32
+_UPPER[ord('\r')] = ord(' ')
+_CLASS = np.zeros(256, dtype=np.uint8)
+_CLASS[ord('A'):ord('Z') + 1] = 1
+_CLASS[[ord(c) for c in '0123456789.-+']] = 2
+
+
+class Toolpath:
+
+    def __init__(self, start, end, e, f, line, n_lines=0, dwell=0., feed_lines=None, known_start=None,
+                 known_end=None):
+        """
+        Constructor of toolpath. Usually created with parse_gcode().
+
+        :param start: (n,3) array - absolute X,Y,Z at start of every move in mm
+        :param end: (n,3) array - absolute X,Y,Z at end of every move in mm
+        :param e: (n,) array - extruded filament length of every move in mm (relative, extrude factor M221 applied)
+        :param f: (n,) array - effective feedrate of every move in mm/min
+        :param line: (n,) array - index of line in G-code script for every move
+        :param n_lines: number of lines of G-code script
+        :param dwell: summed up dwell time (G4) in s
+        :param feed_lines: line indices of G0/G1 without movement (only setting feedrate)
+        :param known_start: (n,3) bool array - axis position at start of move is known (set absolutely before).
+                            Unknown positions are counted from 0. Default all known
+        :param known_end: (n,3) bool array - axis position at end of move is known. Default all known
+        """
+        self.start = np.asarray(start, dtype=float).reshape(-1, 3)
+        self.end = np.asarray(end, dtype=float).reshape(-1, 3)
+        self.e = np.asarray(e, dtype=float)
+        self.f = np.asarray(f, dtype=float)
+        self.line = np.asarray(line, dtype=np.int64)
+        self.n_lines = n_lines
+        self.dwell = dwell
+        self.feed_lines = np.asarray(feed_lines if feed_lines is not None else [], dtype=np.int64)
+        self.known_start = np.ones(self.start.shape, dtype=bool) if known_start is None \
+            else np.asarray(known_start, dtype=bool).reshape(-1, 3)
+        self.known_end = np.ones(self.end.shape, dtype=bool) if known_end is None \
+            else np.asarray(known_end, dtype=bool).reshape(-1, 3)
+
+    def __len__(self):
+        return len(self.e)
+
+    def lengths(self):
+        """
+        Returns length of every move in mm.
+        """
+        return np.linalg.norm(self.end - self.start, axis=1)
+
+    def is_extrusion(self):
+        """
+        Returns mask of printing moves (positive extrusion with XYZ movement).
+        """
+        return (self.e > 0) & (self.lengths() > 0)
+
+    def durations(self):
+        """
+        Returns duration of every move in s, neglecting acceleration. Extruder-only moves are timed by their
+        extrusion length.
+        """
+        dist = self.lengths()
+        dist = np.where(dist > 0, dist, np.abs(self.e))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.where(self.f > 0, dist / (self.f / 60), 0.)
+        return t
+
+    def estimate_print_time(self):
+        """
+        Estimates print time in s (moves at programmed feedrate + dwell times).
+        """
+        return float(np.sum(self.durations()) + self.dwell)
+
+
+def _integrate(value, inc, reset=None):
+    """
+    Absolute coordinate after every event. Events without value keep the coordinate, incremental events add
+    value, absolute events (and resets) set it.
+
+    :param value: (n,) array - parameter value of event, NaN if not given
+    :param inc: (n,) bool array - incremental mode at event
+    :param reset: (n,) bool array - events which always set coordinate (G92)
+    :return: (n,) array
+    """
+    given = ~np.isnan(value)
+    absolute = given & ~inc
+    if reset is not None:
+        absolute |= given & reset
+    increment = np.where(given & ~absolute, value, 0.)
+    cum = np.cumsum(increment)
+    idx = np.arange(len(value))
+    last = np.maximum.accumulate(np.where(absolute, idx, -1))
+    base = np.where(last >= 0, value[np.maximum(last, 0)] - cum[np.maximum(last, 0)], 0.)
+    return base + cum
+
+
+def _is_known(value, inc, reset=None):
+    """
+    Coordinate is known after event, if it was set absolutely (or reset) at or before the event. Before that
+    _integrate() counts increments from 0.
+    """
+    absolute = ~np.isnan(value) & ~inc
+    if reset is not None:
+        absolute |= ~np.isnan(value) & reset
+    return np.logical_or.accumulate(absolute) if len(value) else absolute
+
+
+def _modal(lines, set_lines, unset_lines, n_lines):
+    """
+    Modal state (e.g. G91 active) for given lines. State is set/unset by last preceding set/unset line.
+    """
+    state = np.full(n_lines, -1, dtype=np.int8)
+    state[unset_lines] = 0
+    state[set_lines] = 1
+    idx = np.maximum.accumulate(np.where(state >= 0, np.arange(n_lines), 0))
+    return state[idx][lines] == 1
+
+
+def parse_gcode(script: str) -> Toolpath:
+    """
+    Parses G-code script into Toolpath. Supports G0/G1, G90/G91, M82/M83, G92, G4 and M221 (extrude factor) as
+    generated by CAM_Interface. All other commands (klipper macros, FORCE_MOVE, temperatures) don't move the toolhead
+    in the G-code parser and are skipped. Commands have to start at the beginning of a line.
+
+    Parsing works on the raw bytes of the script with NumPy, so multi-million line programs are parsed
+    without a Python loop over lines.
+
+    :param script: G-code script
+    :return: Toolpath object
+    """
+    buf = _UPPER[np.frombuffer(script.encode('ascii', 'replace') + b'\n' * 4, dtype=np.uint8)]
+    size = len(buf) - 4
+    newlines = np.flatnonzero(buf[:size] == ord('\n'))
+    starts = np.concatenate(([0], newlines + 1))
+    ends = np.concatenate((newlines, [size]))
+    if starts[-1] == size:
+        # Leerzeile nach letztem Zeilenumbruch zählt nicht
+        starts, ends = starts[:-1], ends[:-1]
+    n_lines = len(starts)
+    # Kommentare abschneiden
+    semicolons = np.flatnonzero(buf[:size] == ord(';'))
+    if len(semicolons):
+        comment_line = np.searchsorted(starts, semicolons, side='right') - 1
+        first, idx = np.unique(comment_line, return_index=True)
+        ends[first] = np.minimum(ends[first], semicolons[idx])
+    # Befehl (Buchstabe + Nummer) am Zeilenanfang bestimmen
+    letter = buf[starts]
+    digits = [buf[starts + i] for i in (1, 2, 3, 4)]
+    is_digit = [(d >= ord('0')) & (d <= ord('9')) & (starts + i < ends) for i, d in enumerate(digits, 1)]
+    number = np.where(is_digit[0], digits[0].astype(np.int64) - ord('0'), -1)
+    number = np.where(is_digit[0] & is_digit[1], number * 10 + digits[1] - ord('0'), number)
+    number = np.where(is_digit[0] & is_digit[1] & is_digit[2], number * 10 + digits[2] - ord('0'), number)
+    number = np.where(is_digit[0] & is_digit[1] & is_digit[2] & is_digit[3], -1, number)
+    n_digits = is_digit[0].astype(np.int64) + (is_digit[0] & is_digit[1]) + (is_digit[0] & is_digit[1] & is_digit[2])
+    g = letter == ord('G')
+    m = letter == ord('M')
+    is_move = g & ((number == 0) | (number == 1))
+    is_g92 = g & (number == 92)
+    is_g4 = g & (number == 4)
+    is_m221 = m & (number == 221)
+    # Parameter der relevanten Zeilen (Buchstaben und Zahlen) extrahieren
+    relevant = np.flatnonzero(is_move | is_g92 | is_g4 | is_m221)
+    param_start = starts[relevant] + 1 + n_digits[relevant]
+    param_end = np.maximum(ends[relevant], param_start)
+    delta = np.zeros(len(buf) + 1, dtype=np.int8)
+    delta[param_start] += 1
+    delta[param_end] -= 1
+    char_class = np.where(np.cumsum(delta[:-1], dtype=np.int8) > 0, _CLASS[buf], 0)
+    letters_pos = np.flatnonzero(char_class == 1)
+    text = np.where(char_class == 2, buf, ord(' ')).astype(np.uint8)
+    values = np.fromstring(text.tobytes().decode('ascii'), sep=' ') if len(letters_pos) else np.empty(0)
+    if len(values) != len(letters_pos):
+        raise ValueError("Malformed G-code: every parameter needs a numeric value")
+    letters = buf[letters_pos]
+    letters_line = np.searchsorted(starts, letters_pos, side='right') - 1
+    # Ereignisse (G0/G1, G92) in Zeilenreihenfolge
+    events = np.flatnonzero(is_move | is_g92)
+    event_of_line = np.full(n_lines, -1, dtype=np.int64)
+    event_of_line[events] = np.arange(len(events))
+    params = {}
+    for key in 'XYZEF':
+        arr = np.full(len(events), np.nan)
+        sel = (letters == ord(key)) & (event_of_line[letters_line] >= 0)
+        arr[event_of_line[letters_line[sel]]] = values[sel]
+        params[key] = arr
+    inc = _modal(events, np.flatnonzero(g & (number == 91)), np.flatnonzero(g & (number == 90)), n_lines)
+    inc_e = _modal(events, np.flatnonzero(m & (number == 83)), np.flatnonzero(m & (number == 82)), n_lines)
+    reset = is_g92[events]
+    pos = np.stack([_integrate(params[key], inc, reset) for key in 'XYZ'], axis=1)
+    known = np.stack([_is_known(params[key], inc, reset) for key in 'XYZ'], axis=1)
+    e_pos = _integrate(params['E'], inc_e, reset)
+    # Vorschub gilt modal, G92 setzt keinen Vorschub
+    f = np.where(reset, np.nan, params['F'])
+    f_idx = np.maximum.accumulate(np.where(~np.isnan(f), np.arange(len(f)), 0))
+    feedrate = np.nan_to_num(f[f_idx]) if len(f) else f
+    # Position vor der ersten Bewegung ist unbekannt (Zählung ab 0)
+    start = np.concatenate((np.zeros((1, 3)), pos))[:-1]
+    known_start = np.concatenate((np.zeros((1, 3), dtype=bool), known))[:-1]
+    e = np.diff(np.concatenate(([0.], e_pos)))
+    moved = ~reset & ~(np.isnan(params['X']) & np.isnan(params['Y']) & np.isnan(params['Z']) &
+                       np.isnan(params['E']))
+    e = np.where(np.isnan(params['E']), 0., e)
+    # Extrusionsfaktor M221 S<Prozent> gilt für alle folgenden Bewegungen (wie klipper auch für Rückzug)
+    factor_sel = is_m221[letters_line] & (letters == ord('S'))
+    factor_lines = letters_line[factor_sel]
+    if len(factor_lines):
+        idx = np.searchsorted(factor_lines, events) - 1
+        e = e * np.where(idx >= 0, values[factor_sel][np.maximum(idx, 0)] / 100, 1.)
+    # Verweilzeit G4 P<ms> bzw. S<s>
+    dwell_sel = is_g4[letters_line]
+    dwell = np.sum(values[dwell_sel & (letters == ord('P'))]) / 1e3 + \
+        np.sum(values[dwell_sel & (letters == ord('S'))])
+    return Toolpath(start[moved], pos[moved], e[moved], feedrate[moved], events[moved], n_lines=n_lines,
+                    dwell=float(dwell), feed_lines=events[~moved & ~reset], known_start=known_start[moved],
+                    known_end=known[moved])
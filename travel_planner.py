@@ -0,0 +1,270 @@
+import heapq
+import math
+
+"""
+Travel policy for z-lift and retraction. Printed segments are stored in a uniform grid (per layer), such that
+travels can be tested against printed material. Lift and retraction are skipped for short travels and for
+travels which stay over printed material (ooze and nozzle scratches end up on/in the part). Optionally a
+combing route over printed material is searched (A* over grid cells), which replaces lift and retraction.
+"""
+
+
+def _point_segment_distance(px, py, x0, y0, x1, y1):
+    """
+    Distance of point to segment in XY plane.
+    """
+    dx, dy = x1 - x0, y1 - y0
+    denom = dx * dx + dy * dy
+    t = 0. if denom == 0 else min(max(((px - x0) * dx + (py - y0) * dy) / denom, 0.), 1.)
+    return math.hypot(px - x0 - t * dx, py - y0 - t * dy)
+
+
+class SegmentGrid:
+
+    def __init__(self, cell_size=1., layer_precision=1e-3):
+        """
+        Uniform grid of printed segments.
+
+        :param cell_size: edge length of grid cells in mm. About the line width is a good choice
+        :param layer_precision: Z values closer than this are in the same layer (mm)
+        """
+        self._cell = cell_size
+        self._precision = layer_precision
+        # (x0, y0, x1, y1, halbe Linienbreite)
+        self._segments = []
+        # Layer -> Zelle -> Segmente, die Punkte der Zelle abdecken können
+        self._cells = {}
+        # Layer -> Zellen, deren Mittelpunkt abgedeckt ist (Knoten für Combing)
+        self._solid = {}
+
+    def __len__(self):
+        return len(self._segments)
+
+    def _layer(self, z: float) -> int:
+        return round(z / self._precision)
+
+    def _index(self, x: float, y: float):
+        return math.floor(x / self._cell), math.floor(y / self._cell)
+
+    def _center(self, cell):
+        return (cell[0] + .5) * self._cell, (cell[1] + .5) * self._cell
+
+    def _layers(self, z: float, depth: float):
+        """
+        Layer keys with z - depth <= Z <= z.
+        """
+        top, bottom = self._layer(z), self._layer(z - depth)
+        return [layer for layer in self._cells if bottom <= layer <= top]
+
+    def add(self, start, end, width: float):
+        """
+        Adds printed segment.
+
+        :param start: (x, y, z) start point
+        :param end: (x, y, z) end point
+        :param width: line width in mm
+        """
+        i = len(self._segments)
+        x0, y0, x1, y1, r = start[0], start[1], end[0], end[1], width / 2
+        self._segments.append((x0, y0, x1, y1, r))
+        layer = self._layer(end[2])
+        cells = self._cells.setdefault(layer, {})
+        solid = self._solid.setdefault(layer, set())
+        # Zellen, in denen ein Punkt näher als r am Segment liegen kann
+        reach = r + self._cell * math.sqrt(.5)
+        ix0, iy0 = self._index(min(x0, x1) - r, min(y0, y1) - r)
+        ix1, iy1 = self._index(max(x0, x1) + r, max(y0, y1) + r)
+        for ix in range(ix0, ix1 + 1):
+            for iy in range(iy0, iy1 + 1):
+                cx, cy = self._center((ix, iy))
+                d = _point_segment_distance(cx, cy, x0, y0, x1, y1)
+                if d <= reach:
+                    cells.setdefault((ix, iy), []).append(i)
+                    if d <= r:
+                        solid.add((ix, iy))
+
+    def is_covered(self, x: float, y: float, layers) -> bool:
+        """
+        Checks if point is on printed material of given layers.
+        """
+        cell = self._index(x, y)
+        for layer in layers:
+            for i in self._cells[layer].get(cell, ()):
+                x0, y0, x1, y1, r = self._segments[i]
+                if _point_segment_distance(x, y, x0, y0, x1, y1) <= r:
+                    return True
+        return False
+
+    def is_path_covered(self, a, b, z: float, depth=0., layers=None) -> bool:
+        """
+        Checks if straight travel a-b stays over printed material. Travel is sampled with half the cell size.
+
+        :param a: (x, y) start
+        :param b: (x, y) end
+        :param z: Z of travel
+        :param depth: material down to z - depth counts as printed material
+        """
+        layers = self._layers(z, depth) if layers is None else layers
+        if not layers:
+            return False
+        n = max(1, math.ceil(math.hypot(b[0] - a[0], b[1] - a[1]) / (self._cell / 2)))
+        return all(self.is_covered(a[0] + (b[0] - a[0]) * k / n, a[1] + (b[1] - a[1]) * k / n, layers)
+                   for k in range(n + 1))
+
+    def comb(self, a, b, z: float, depth=0., max_length=math.inf):
+        """
+        Searches route over printed material (A* over cells with covered centre, 8-neighbourhood). The route is
+        shortened by skipping waypoints, as long as the direct connection stays over printed material.
+
+        :param a: (x, y) start
+        :param b: (x, y) end
+        :param z: Z of travel
+        :param depth: material down to z - depth counts as printed material
+        :param max_length: max. length of route in mm
+        :return: list of (x, y) waypoints between a and b or None, if there is no route
+        """
+        layers = self._layers(z, depth)
+        if not layers:
+            return None
+        solid = set().union(*(self._solid[layer] for layer in layers))
+        start, goal = self._index(*a), self._index(*b)
+        if start not in solid or goal not in solid \
+                or not self.is_path_covered(a, self._center(start), z, layers=layers) \
+                or not self.is_path_covered(self._center(goal), b, z, layers=layers):
+            return None
+        gx, gy = self._center(goal)
+        budget = max_length / self._cell
+
+        def h(cell):
+            return math.hypot(cell[0] - goal[0], cell[1] - goal[1])
+
+        came_from = {start: None}
+        cost = {start: 0.}
+        queue = [(h(start), start)]
+        while queue:
+            _, cell = heapq.heappop(queue)
+            if cell == goal:
+                break
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    step = (cell[0] + dx, cell[1] + dy)
+                    if step == cell or step not in solid:
+                        continue
+                    # Diagonal nur, wenn beide Nachbarn belegt sind (keine Ecken abschneiden)
+                    if dx and dy and ((cell[0] + dx, cell[1]) not in solid or (cell[0], cell[1] + dy) not in solid):
+                        continue
+                    g = cost[cell] + math.hypot(dx, dy)
+                    if g + h(step) <= budget and g < cost.get(step, math.inf):
+                        cost[step] = g
+                        came_from[step] = cell
+                        heapq.heappush(queue, (g + h(step), step))
+        else:
+            return None
+        cells = []
+        while cell is not None:
+            cells.append(cell)
+            cell = came_from[cell]
+        points = [tuple(a)] + [self._center(cell) for cell in reversed(cells)] + [tuple(b)]
+        # Wegpunkte auslassen, solange die Abkürzung über gedrucktem Material liegt
+        route = [points[0]]
+        i = 0
+        while i < len(points) - 1:
+            j = len(points) - 1
+            while j > i + 1 and not self.is_path_covered(points[i], points[j], z, layers=layers):
+                j -= 1
+            route.append(points[j])
+            i = j
+        length = sum(math.hypot(q[0] - p[0], q[1] - p[1]) for p, q in zip(route[:-1], route[1:]))
+        if length > max_length:
+            return None
+        return route[1:-1]
+
+
+class TravelPolicy:
+
+    def __init__(self, min_distance=1., depth=0., combing=False, max_comb_ratio=2., cell_size=1.,
+                 layer_precision=1e-3):
+        """
+        Decides for every travel, if z-lift and retraction are necessary.
+
+        :param min_distance: travels shorter than this (mm) are done without lift/retraction
+        :param depth: material down to Z - depth counts as printed material (e.g. layer height to include layer
+                      below)
+        :param combing: search route over printed material instead of lift/retraction
+        :param max_comb_ratio: max. length of combing route relative to direct travel
+        :param cell_size: cell size of spatial index in mm
+        :param layer_precision: Z values closer than this are in the same layer (mm)
+        """
+        self._min_distance = min_distance
+        self._depth = depth
+        self._combing = combing
+        self._max_comb_ratio = max_comb_ratio
+        self._cell_size = cell_size
+        self._layer_precision = layer_precision
+        self.grid = SegmentGrid(cell_size, layer_precision)
+        self.travels = 0
+        self.lifts_saved = 0
+        self.retracts_saved = 0
+        self.combed = 0
+
+    def register(self, start, end, width: float):
+        """
+        Registers printed segment, see SegmentGrid.add.
+        """
+        self.grid.add(start, end, width)
+
+    def register_script(self, script: str, width: float):
+        """
+        Registers all printing moves of G-code script (e.g. to continue generation of an existing script).
+
+        :param script: G-code script
+        :param width: line width in mm
+        """
+        from toolpath import parse_gcode
+        toolpath = parse_gcode(script)
+        for i in toolpath.is_extrusion().nonzero()[0]:
+            self.grid.add(toolpath.start[i], toolpath.end[i], width)
+
+    def clear(self):
+        """
+        Removes all registered segments. Statistics are kept.
+        """
+        self.grid = SegmentGrid(self._cell_size, self._layer_precision)
+
+    def plan(self, start, end, lift: bool, retract: bool):
+        """
+        Plans XY travel at Z of start.
+
+        :param start: (x, y, z) start point
+        :param end: (x, y) end point
+        :param lift: z-lift requested
+        :param retract: retraction requested
+        :return: tupel(lift, retract, waypoints) - waypoints is list of (x, y) of combing route
+        """
+        self.travels += 1
+        if not (lift or retract):
+            return lift, retract, []
+        distance = math.hypot(end[0] - start[0], end[1] - start[1])
+        route = []
+        if distance >= self._min_distance and \
+                not self.grid.is_path_covered(start[:2], end, start[2], self._depth):
+            if not self._combing:
+                return lift, retract, []
+            route = self.grid.comb(start[:2], end, start[2], self._depth, self._max_comb_ratio * distance)
+            if route is None:
+                return lift, retract, []
+            self.combed += 1
+        self.lifts_saved += lift
+        self.retracts_saved += retract
+        return False, False, route
+
+    def statistics(self) -> dict:
+        """
+        Returns number of planned travels, saved lifts and retractions and combed travels.
+        """
+        return {'travels': self.travels, 'lifts_saved': self.lifts_saved, 'retracts_saved': self.retracts_saved,
+                'combed': self.combed, 'segments': len(self.grid)}
+
+    def __str__(self):
+        return (f"Travels:\t {self.travels:d} ({self.combed:d} combed)\n"
+                f"Saved:\t\t {self.lifts_saved:d} z-lifts, {self.retracts_saved:d} retractions")